@@ -15,19 +15,50 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-i
 # Initialize database with app
 db.init_app(app)
 
+# SQLite: the pysqlite driver opens a transaction before INSERT/UPDATE/
+# DELETE but not before a SAVEPOINT, so a savepoint's RELEASE commits on
+# its own instead of nesting in the caller's transaction. As in
+# SQLAlchemy's documented workaround the driver's handling is switched off
+# (https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#pysqlite-serializable),
+# but BEGIN is only emitted before the first write, DDL or SAVEPOINT, so
+# plain reads still take no lock. BEGIN IMMEDIATE takes the write lock
+# (waiting out the busy timeout) before anything is read in the transaction.
+SQLITE_WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'SAVEPOINT', 'CREATE', 'ALTER', 'DROP')
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+def _sqlite_begin_before_write(conn, cursor, statement, parameters, context, executemany):
+    if not cursor.connection.in_transaction and statement.lstrip().upper().startswith(SQLITE_WRITE_STATEMENTS):
+        cursor.connection.execute('BEGIN IMMEDIATE')
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        from sqlalchemy import event
+        event.listen(db.engine, 'connect', _sqlite_connect)
+        event.listen(db.engine, 'before_cursor_execute', _sqlite_begin_before_write)
+
 # Import models and routes (after db initialization)
 from models import FDADeviceRecall, RecallCheckHistory
+from recall_search import ensure_search_index, search_recalls
+from recall_stats import ensure_stats, get_stats, get_top, get_total
+from response_cache import cached_response
 
 # Register blueprints
 from routes import fetch_recalls_bp, api_bp
 app.register_blueprint(fetch_recalls_bp)
 app.register_blueprint(api_bp)
 
+# Request timing and the /metrics endpoint
+from metrics import init_metrics
+init_metrics(app)
+
 @app.route('/')
+@cached_response
 def index():
     """Main dashboard page"""
     try:
-        total_recalls = FDADeviceRecall.query.count()
+        total_recalls = get_total()
         recent_recalls = FDADeviceRecall.query.order_by(
             FDADeviceRecall.recall_date.desc()
         ).limit(10).all()
@@ -43,6 +74,7 @@ def index():
                          recent_recalls=recent_recalls)
 
 @app.route('/recalls')
+@cached_response
 def recalls():
     """List all recalls with pagination"""
     page = request.args.get('page', 1, type=int)
@@ -52,18 +84,12 @@ def recalls():
     query = FDADeviceRecall.query
     
     if search:
-        query = query.filter(
-            db.or_(
-                FDADeviceRecall.device_name.contains(search),
-                FDADeviceRecall.recall_number.contains(search),
-                FDADeviceRecall.recall_firm.contains(search),
-                FDADeviceRecall.product_code.contains(search)
-            )
-        )
+        # Best matches first
+        query = search_recalls(query, search)
+    else:
+        query = query.order_by(FDADeviceRecall.recall_date.desc())
     
-    pagination = query.order_by(
-        FDADeviceRecall.recall_date.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
     return render_template('recalls.html',
                          recalls=pagination.items,
@@ -71,6 +97,7 @@ def recalls():
                          search=search)
 
 @app.route('/recall/<int:recall_id>')
+@cached_response
 def recall_detail(recall_id):
     """View details of a specific recall"""
     recall = FDADeviceRecall.query.get_or_404(recall_id)
@@ -81,15 +108,11 @@ def stats():
     """Statistics page"""
     from datetime import timedelta
     
-    total = FDADeviceRecall.query.count()
-    by_status = db.session.query(
-        FDADeviceRecall.status,
-        db.func.count(FDADeviceRecall.id)
-    ).group_by(FDADeviceRecall.status).all()
-    
-    recent_count = FDADeviceRecall.query.filter(
-        FDADeviceRecall.recall_date >= datetime.now().replace(day=1)
-    ).count()
+    # Read from the recall_stat table, maintained as recalls are written
+    total = get_total()
+    by_status = list(get_stats('status').items())
+    recent_count = get_stats('month').get(datetime.now().strftime('%Y-%m'), 0)
+    top_firms = get_top('firm', 10)
     
     # Get last 30 days of check history
     thirty_days_ago = datetime.now() - timedelta(days=30)
@@ -97,17 +120,25 @@ def stats():
         RecallCheckHistory.check_date >= thirty_days_ago
     ).order_by(RecallCheckHistory.check_date.desc()).all()
     
+    # Oldest first for the timing trend chart; runs from before timing was recorded are left out
+    timing_trend = [check.timing_dict() for check in reversed(check_history)
+                    if check.duration_seconds is not None]
+    
     return render_template('stats.html',
                          total=total,
                          by_status=by_status,
                          recent_count=recent_count,
-                         check_history=check_history)
+                         top_firms=top_firms,
+                         check_history=check_history,
+                         timing_trend=timing_trend)
 
 # Initialize database
 def init_db():
     """Initialize database tables"""
     with app.app_context():
         db.create_all()
+        ensure_search_index()
+        ensure_stats()
 
 if __name__ == '__main__':
     # For development
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Backfill the full FDA recall history by date window
+
+The openFDA API will not page past a fixed skip offset, so a single
+query can never return more than MAX_SKIP records. This script splits the
+requested date range into event_date_posted:[A TO B] windows, bisecting
+any window that still holds more records than the cap, then fetches the
+windows in parallel and bulk-writes each one as it arrives. New recalls
+are queued for the ERPNext inventory check with the page that inserts them.
+
+Finished windows are recorded as completed checkpoints, so re-running the
+same backfill skips the windows that already loaded.
+
+Run: python3 backfill_recalls.py --start 2002-01-01 --end 2025-12-31 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from app import app
+from database import db
+from models import IngestCheckpoint
+from recall_store import safe_upsert_recalls
+from erpnext_dispatch import enqueue_inserted_recalls
+from fetch_fda_recalls import (
+    BATCH_SIZE, MAX_SKIP, build_recall_rows, count_fda_results, iter_fda_pages,
+    record_checkpoint
+)
+
+# Earliest event_date_posted in the openFDA device recall dataset is late 2002
+BACKFILL_START = date(2002, 1, 1)
+CHECKPOINT_SOURCE = 'backfill'
+
+def window_search(start, end):
+    """openFDA search expression for an inclusive date window"""
+    return f"event_date_posted:[{start.strftime('%Y%m%d')} TO {end.strftime('%Y%m%d')}]"
+
+def split_window(start, end, cap=MAX_SKIP):
+    """
+    Split [start, end] into windows that each hold at most cap records
+
+    Windows over the cap are bisected until they fit. A single day that
+    is still over the cap cannot be split further and is returned as is.
+
+    Returns:
+        List of (start, end, total) tuples in date order
+    """
+    total = count_fda_results(window_search(start, end))
+    if total <= cap or start == end:
+        if total > cap:
+            print(f"⚠ {start} holds {total} records, only the first {cap} can be fetched")
+        return [(start, end, total)] if total else []
+    middle = start + (end - start) // 2
+    return split_window(start, middle, cap) + split_window(middle + timedelta(days=1), end, cap)
+
+def plan_windows(start, end, workers=4, cap=MAX_SKIP):
+    """Split the range into yearly windows, then bisect each one in parallel"""
+    years = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(date(window_start.year, 12, 31), end)
+        years.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        planned = executor.map(lambda window: split_window(window[0], window[1], cap), years)
+        return [window for windows in planned for window in windows]
+
+def fetch_window(start, end, page_workers=1):
+    """Fetch every page of one window; runs in a worker thread"""
+    started = time.time()
+    results = []
+    for skip, page in iter_fda_pages(window_search(start, end), workers=page_workers):
+        results.extend(page)
+    return results, time.time() - started
+
+def backfill(start, end, workers=4, page_workers=1):
+    """
+    Load all recalls posted between start and end (inclusive)
+
+    Windows are fetched concurrently; writes happen on the calling thread,
+    one bulk upsert per page and one commit per window.
+
+    Returns:
+        (records fetched, records inserted)
+    """
+    with app.app_context():
+        print(f"Planning windows from {start} to {end}...")
+        windows = plan_windows(start, end, workers=workers)
+
+        done = {
+            checkpoint.search for checkpoint in IngestCheckpoint.query.filter_by(
+                source=CHECKPOINT_SOURCE, completed=True
+            )
+        }
+        pending = [window for window in windows if window_search(window[0], window[1]) not in done]
+        expected = sum(total for _, _, total in pending)
+        print(f"{len(windows)} windows planned, {len(windows) - len(pending)} already loaded, "
+              f"{len(pending)} to fetch ({expected} records)")
+        print("")
+
+        total_fetched = 0
+        total_inserted = 0
+        run_started = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(fetch_window, window_start, window_end, page_workers): (window_start, window_end, total)
+                for window_start, window_end, total in pending
+            }
+            for finished, future in enumerate(as_completed(futures), 1):
+                window_start, window_end, total = futures[future]
+                search = window_search(window_start, window_end)
+                try:
+                    results, elapsed = future.result()
+                except Exception as e:
+                    print(f"[{finished}/{len(pending)}] {window_start} – {window_end}: ✗ fetch failed: {e}")
+                    continue
+
+                checkpoint = IngestCheckpoint(source=CHECKPOINT_SOURCE, search=search)
+                db.session.add(checkpoint)
+                inserted = 0
+                for offset in range(0, len(results), BATCH_SIZE):
+                    page = results[offset:offset + BATCH_SIZE]
+                    rows = build_recall_rows(page)
+                    # New recalls are queued for the ERPNext inventory check with their page
+                    written = enqueue_inserted_recalls(page, rows, safe_upsert_recalls(rows))
+                    record_checkpoint(checkpoint, offset, page, written)
+                    inserted += written
+                # A window cut short by fetch errors stays open so a re-run fetches it again
+                checkpoint.completed = len(results) >= min(total, MAX_SKIP)
+                db.session.commit()
+
+                total_fetched += len(results)
+                total_inserted += inserted
+                rate = len(results) / elapsed if elapsed else 0
+                short = "" if checkpoint.completed else " (incomplete)"
+                print(f"[{finished}/{len(pending)}] {window_start} – {window_end}: "
+                      f"{len(results)}/{total} records, {inserted} new, "
+                      f"{elapsed:.1f}s ({rate:.0f} rec/s){short}")
+
+        elapsed = time.time() - run_started
+        print("")
+        print("=== Backfill Complete ===")
+        print(f"Records fetched: {total_fetched}")
+        print(f"New records inserted: {total_inserted}")
+        print(f"Elapsed: {elapsed:.1f}s")
+        return total_fetched, total_inserted
+
+def _parse_cli_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill FDA device recalls by date window")
+    parser.add_argument('--start', type=_parse_cli_date, default=BACKFILL_START,
+                        help=f"First event_date_posted to load, YYYY-MM-DD (default {BACKFILL_START})")
+    parser.add_argument('--end', type=_parse_cli_date, default=date.today(),
+                        help="Last event_date_posted to load, YYYY-MM-DD (default today)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of windows fetched in parallel (default 4)")
+    parser.add_argument('--page-workers', type=int, default=1,
+                        help="Number of pages fetched in parallel within a window (default 1)")
+    args = parser.parse_args()
+
+    backfill(args.start, args.end, workers=args.workers, page_workers=args.page_workers)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark Part Number / Model/Catalog Number extraction
+
+Compares the original one-regex-at-a-time extractors (reproduced below as
+the baseline) with the combined scanner in extraction.py over the
+code_info/product_description samples in fixtures/code_info_samples.json,
+and checks that both produce identical results.
+
+Run: python3 bench_extraction.py [--repeat 500]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from extraction import extract_identifiers_batch
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'code_info_samples.json')
+
+def _legacy_extract(text, patterns):
+    """Original extractor: re.search each pattern in turn"""
+    if not text:
+        return None
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        if match:
+            value = match.group(1).strip()
+            value = re.sub(r'\s+', ' ', value)
+            value = value.split(';')[0].split(',')[0].strip()
+            if value:
+                return value
+    return None
+
+LEGACY_PART_PATTERNS = [
+    r'Part Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+    r'Part[:\s]+Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+    r'Part\s*#\s*[:\s]*([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+]
+LEGACY_MODEL_PATTERNS = [
+    r'Model/Catalog Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+    r'Model/Catalog[:\s]+Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+    r'Catalog Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+    r'Model Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+    r'Model[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
+]
+
+def legacy_batch(records):
+    """Per-record extraction as the fetch loop originally did it"""
+    results = []
+    for code_info, description in records:
+        part = _legacy_extract(code_info, LEGACY_PART_PATTERNS)
+        model = _legacy_extract(code_info, LEGACY_MODEL_PATTERNS)
+        if not model:
+            model = _legacy_extract(description, LEGACY_MODEL_PATTERNS)
+        results.append((part, model))
+    return results
+
+def _time(func, records, rounds=5):
+    """Best-of-rounds wall time for one pass over records"""
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func(records)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark identifier extraction")
+    parser.add_argument('--repeat', type=int, default=500,
+                        help="Times the fixture corpus is repeated (default 500)")
+    args = parser.parse_args()
+
+    with open(FIXTURE) as f:
+        samples = json.load(f)
+    records = [(s['code_info'], s['product_description']) for s in samples] * args.repeat
+
+    if legacy_batch(records[:len(samples)]) != extract_identifiers_batch(records[:len(samples)]):
+        raise SystemExit("✗ Combined extractor disagrees with the original patterns")
+
+    before = _time(legacy_batch, records)
+    after = _time(extract_identifiers_batch, records)
+
+    print(f"Records per pass: {len(records)} ({len(samples)} samples x {args.repeat})")
+    print(f"Before (per-pattern re.search): {len(records) / before:,.0f} records/sec")
+    print(f"After  (combined scanner):      {len(records) / after:,.0f} records/sec")
+    print(f"Speedup: {before / after:.1f}x")
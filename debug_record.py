@@ -4,7 +4,7 @@ Debug script to check a specific record and see why it's not updating
 """
 from app import app
 from models import FDADeviceRecall
-from update_existing_product_codes import extract_model_catalog_number
+from extraction import extract_model_catalog_number
 
 with app.app_context():
     # Find the specific record
@@ -0,0 +1,316 @@
+"""
+ERPNext inventory cross-reference dispatch
+New recalls are written to a durable outbox in the same transaction as
+the recalls themselves. A dispatcher, started on its own thread once a
+fetch job has finished and periodically by the scheduler (except while a
+fetch is running), sends them to ERPNext in bounded batches over a
+pooled session, retries failures with backoff, and marks every outbox
+row once ERPNext has accepted it. A pass ends at the first failed batch,
+so an unreachable ERPNext costs one timeout per pass, not one per batch.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+
+from database import db
+from http_archive import mount_archive
+from models import ERPNextOutbox, RecallCheckHistory
+from run_timings import RunTimings
+from metrics import record_erpnext_batch
+
+# ERPNext Configuration (override to point at a test site or fake_fda_server.py)
+ERPNEXT_URL = os.environ.get('ERPNEXT_URL', "https://beta.surgi.shop/api/method/recall_cross_reference.check_inventory")
+ERPNEXT_API_KEY = os.environ.get('ERPNEXT_API_KEY', "ae0d7bdc5c61e8b")
+ERPNEXT_API_SECRET = os.environ.get('ERPNEXT_API_SECRET', "c637ae040a3eae7")
+
+# Recalls per POST to ERPNext
+ERPNEXT_BATCH_SIZE = int(os.environ.get('ERPNEXT_BATCH_SIZE', 50))
+# Give up on a recall (status 'failed') after this many attempts
+ERPNEXT_MAX_ATTEMPTS = int(os.environ.get('ERPNEXT_MAX_ATTEMPTS', 8))
+# First retry delay in seconds; doubles with every failed attempt
+ERPNEXT_RETRY_BASE_SECONDS = 60
+ERPNEXT_RETRY_MAX_SECONDS = 6 * 60 * 60
+# A batch claimed this long ago without finishing is assumed abandoned
+ERPNEXT_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+_session = None
+_session_lock = threading.Lock()
+_dispatch_lock = threading.Lock()
+
+def get_erpnext_session():
+    """Return the shared keep-alive session used for ERPNext requests"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update({
+                'Content-Type': 'application/json',
+                'Authorization': f'token {ERPNEXT_API_KEY}:{ERPNEXT_API_SECRET}'
+            })
+            # Record or replay traffic when HTTP_ARCHIVE_MODE is set
+            mount_archive(session)
+            _session = session
+        return _session
+
+def format_recall_for_erpnext(recall):
+    """Format one recall dict for the ERPNext check_inventory API"""
+    recall_date = recall.get('recall_date')
+    return {
+        'id': recall.get('id'),
+        'recall_number': recall.get('recall_number'),
+        'device_name': recall.get('device_name'),
+        'product_code': recall.get('product_code'),
+        'code_info': recall.get('code_info'),
+        'recall_date': recall_date.isoformat() if hasattr(recall_date, 'isoformat') else recall_date,
+        'status': recall.get('status'),
+        'reason': recall.get('reason')
+    }
+
+def send_recalls_to_erpnext(recalls_list, idempotency_key=None):
+    """
+    Send recalls to ERPNext for inventory cross-reference
+
+    Args:
+        recalls_list: List of recall dictionaries to check against inventory
+        idempotency_key: Key identifying this batch, so ERPNext can ignore a resend
+
+    Returns:
+        dict with response from ERPNext or error info
+    """
+    if not recalls_list:
+        return {"success": False, "message": "No recalls to send"}
+
+    try:
+        headers = {}
+        body = {'recalls': [format_recall_for_erpnext(recall) for recall in recalls_list]}  # Send as list, not JSON string
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+            body['idempotency_key'] = idempotency_key
+
+        response = get_erpnext_session().post(ERPNEXT_URL, headers=headers, json=body, timeout=60)
+
+        if response.status_code == 200:
+            result = response.json()
+            result['success'] = True
+            print(f"✓ ERPNext check complete: {result.get('message', {}).get('matched_count', 0)} matches found")
+            return result
+        else:
+            error_msg = f"ERPNext API error {response.status_code}: {response.text}"
+            print(f"✗ {error_msg}")
+            return {"success": False, "error": error_msg}
+
+    except Exception as e:
+        error_msg = f"Error sending to ERPNext: {str(e)}"
+        print(f"✗ {error_msg}")
+        return {"success": False, "error": error_msg}
+
+def enqueue_recalls(recalls_list):
+    """
+    Add new recalls to the ERPNext outbox
+
+    Runs in the caller's transaction, so the outbox rows are committed
+    together with the recalls they describe. On SQLite this relies on
+    app.py opening the transaction before safe_upsert_recalls' savepoint;
+    otherwise the savepoint's RELEASE would commit the recalls on their own.
+    """
+    if not recalls_list:
+        return
+    db.session.execute(db.insert(ERPNextOutbox), [
+        {
+            'recall_id': recall.get('id'),
+            'recall_number': recall['recall_number'],
+            'payload': json.dumps(format_recall_for_erpnext(recall)),
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': datetime.now()
+        }
+        for recall in recalls_list
+    ])
+
+def enqueue_inserted_recalls(items, rows, inserted):
+    """
+    Add the recalls of a page that were newly inserted to the ERPNext outbox
+
+    Every path that stores new recalls (fetch, backfill, bulk import)
+    queues them this way, in the transaction that inserted them.
+
+    Args:
+        items: openFDA results of the page
+        rows: Their column dicts, as built by build_recall_rows
+        inserted: recall_number -> id map returned by safe_upsert_recalls
+
+    Returns:
+        Number of recalls queued
+    """
+    inserted = dict(inserted or {})
+    new_recalls = []
+    for item, row in zip(items, rows):
+        # pop: a recall repeated within the page is queued once
+        if row['recall_number'] not in inserted:
+            continue
+        new_recalls.append({
+            'id': inserted.pop(row['recall_number']),
+            'recall_number': row['recall_number'],
+            'device_name': item.get("product_description") or "Unknown Device",
+            'product_code': row['product_code'],
+            'code_info': item.get("code_info"),
+            'recall_date': row['recall_date'],
+            'status': item.get("recall_status"),
+            'reason': item.get("reason_for_recall")
+        })
+    enqueue_recalls(new_recalls)
+    return len(new_recalls)
+
+def _claim_batch(limit):
+    """Claim up to limit due outbox rows for this dispatcher and return them"""
+    now = datetime.now()
+
+    # Release batches whose dispatcher died mid-send
+    db.session.execute(
+        db.update(ERPNextOutbox)
+        .where(ERPNextOutbox.status == 'sending', ERPNextOutbox.claimed_at < now - ERPNEXT_CLAIM_TIMEOUT)
+        .values(status='pending', claim_token=None)
+    )
+
+    due_ids = db.session.execute(
+        db.select(ERPNextOutbox.id)
+        .where(ERPNextOutbox.status == 'pending', ERPNextOutbox.next_attempt_at <= now)
+        .order_by(ERPNextOutbox.id)
+        .limit(limit)
+    ).scalars().all()
+    if not due_ids:
+        db.session.commit()
+        return []
+
+    # Only rows still pending are taken, so two dispatchers never share a row
+    token = str(uuid.uuid4())
+    db.session.execute(
+        db.update(ERPNextOutbox)
+        .where(ERPNextOutbox.id.in_(due_ids), ERPNextOutbox.status == 'pending')
+        .values(status='sending', claim_token=token, claimed_at=now)
+    )
+    db.session.commit()
+    return ERPNextOutbox.query.filter_by(claim_token=token).order_by(ERPNextOutbox.id).all()
+
+def _retry_delay(attempts):
+    """Exponential backoff with jitter for the given attempt count"""
+    delay = min(ERPNEXT_RETRY_BASE_SECONDS * 2 ** (attempts - 1), ERPNEXT_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+def dispatch_outbox(max_batches=None):
+    """
+    Send due outbox rows to ERPNext in batches of ERPNEXT_BATCH_SIZE
+
+    Stops after the first batch ERPNext does not accept; its rows and the
+    rest of the queue wait for the next pass. Must be called inside an
+    app context.
+
+    Returns:
+        dict with counts of recalls sent, failed and inventory matches found
+    """
+    summary = {'sent': 0, 'failed': 0, 'batches': 0, 'matches_found': 0}
+    timings = RunTimings()
+    while max_batches is None or summary['batches'] < max_batches:
+        batch = _claim_batch(ERPNEXT_BATCH_SIZE)
+        if not batch:
+            break
+        summary['batches'] += 1
+
+        # Same set of recalls -> same key, so a resent batch can be recognised
+        key = hashlib.sha256('\n'.join(sorted(row.recall_number for row in batch)).encode()).hexdigest()
+        start = time.perf_counter()
+        with timings.stage('dispatch'):
+            result = send_recalls_to_erpnext([json.loads(row.payload) for row in batch], idempotency_key=key)
+        record_erpnext_batch(time.perf_counter() - start, len(batch), result.get('success'))
+        timings.records += len(batch)
+
+        now = datetime.now()
+        for row in batch:
+            row.idempotency_key = key
+            row.claim_token = None
+            row.attempts += 1
+            if result.get('success'):
+                row.status = 'sent'
+                row.sent_at = now
+                row.last_error = None
+            else:
+                row.last_error = (result.get('error') or 'Unknown error')[:500]
+                if row.attempts >= ERPNEXT_MAX_ATTEMPTS:
+                    row.status = 'failed'
+                else:
+                    row.status = 'pending'
+                    row.next_attempt_at = now + _retry_delay(row.attempts)
+
+        if result.get('success'):
+            summary['sent'] += len(batch)
+            summary['matches_found'] += result.get('message', {}).get('matched_count', 0) or 0
+        else:
+            summary['failed'] += len(batch)
+        db.session.commit()
+        if not result.get('success'):
+            break
+
+    if summary['batches']:
+        notes = (f"ERPNext: sent {summary['sent']} recalls in {summary['batches']} batches, "
+                 f"{summary['matches_found']} inventory matches found")
+        if summary['failed']:
+            notes += f"; {summary['failed']} recalls will be retried"
+        db.session.add(timings.apply(RecallCheckHistory(
+            check_date=datetime.now(),
+            new_recalls_count=0,
+            inventory_checked=summary['sent'] > 0,
+            matches_found=summary['matches_found'],
+            notes=notes[:500]
+        )))
+        db.session.commit()
+        print(notes)
+    return summary
+
+def dispatch_erpnext_outbox():
+    """
+    Run the dispatcher with its own app context (scheduler entry point)
+
+    Skipped while a fetch job is running anywhere in the deployment, so
+    the dispatcher never writes to the database alongside a fetch; the
+    job starts a dispatch once it has finished.
+    """
+    from fetch_jobs import fetch_in_progress
+    # One dispatcher per process at a time; other processes are kept apart by the row claims
+    if not _dispatch_lock.acquire(blocking=False):
+        return None
+    try:
+        from app import app
+        with app.app_context():
+            try:
+                if fetch_in_progress():
+                    return None
+                return dispatch_outbox()
+            finally:
+                db.session.remove()
+    finally:
+        _dispatch_lock.release()
+
+def _dispatch_in_thread():
+    try:
+        dispatch_erpnext_outbox()
+    except Exception as e:
+        # The recalls stay queued; the scheduler's dispatcher retries them
+        print(f"⚠ ERPNext dispatch after fetch failed: {e}")
+
+def start_dispatch():
+    """
+    Send queued recalls on a background thread, e.g. once a fetch job has finished
+
+    The fetch job is not held while ERPNext answers, so a slow or
+    unreachable ERPNext never delays a fetch or keeps its slot busy.
+    """
+    thread = threading.Thread(target=_dispatch_in_thread, name='erpnext-dispatch', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,132 @@
+"""
+Part Number and Model/Catalog Number extraction from FDA recall text
+
+All identifier patterns are compiled once into a single combined regex.
+Each text is scanned once for the keywords that can start an identifier
+(Part, Model, Catalog), and the combined pattern is only tried at those
+positions, so texts without any keyword cost a single C-level scan.
+
+Results are identical to trying each pattern in priority order with
+re.search: for each kind of identifier, the highest-priority pattern that
+matches anywhere wins, at its leftmost match.
+"""
+import re
+
+_FLAGS = re.IGNORECASE | re.MULTILINE
+
+# Value captured after a label: letters, digits, spaces and dashes up to ; , newline or end
+_VALUE = r'[A-Za-z0-9\s\-]+?'
+_END = r'(?:;|,|\n|$)'
+
+# Labels in priority order - the first label that matches anywhere wins
+PART_NUMBER_LABELS = (
+    r'Part Number[:\s]+',
+    r'Part[:\s]+Number[:\s]+',
+    r'Part\s*#\s*[:\s]*',
+)
+MODEL_CATALOG_LABELS = (
+    r'Model/Catalog Number[:\s]+',
+    r'Model/Catalog[:\s]+Number[:\s]+',
+    r'Catalog Number[:\s]+',
+    r'Model Number[:\s]+',
+    r'Model[:\s]+',
+)
+
+# Every label starts with one of these words
+_KEYWORDS = re.compile(r'part|model|catalog', _FLAGS)
+
+def _alternatives():
+    for kind, labels in (('part', PART_NUMBER_LABELS), ('model', MODEL_CATALOG_LABELS)):
+        for priority, label in enumerate(labels):
+            yield kind, priority, label
+
+# One named group per label, e.g. (?P<part_0>...) - alternation order is priority order
+_COMBINED = re.compile(
+    '|'.join(f'{label}(?P<{kind}_{priority}>{_VALUE}){_END}' for kind, priority, label in _alternatives()),
+    _FLAGS
+)
+
+# Individual patterns, only used when a winning match cleans up to nothing
+_SEQUENTIAL = {
+    kind: [re.compile(f'{label}({_VALUE}){_END}', _FLAGS) for label in labels]
+    for kind, labels in (('part', PART_NUMBER_LABELS), ('model', MODEL_CATALOG_LABELS))
+}
+
+_WHITESPACE = re.compile(r'\s+')
+
+def _clean(value):
+    """Collapse whitespace and keep only the part before any ; or ,"""
+    value = _WHITESPACE.sub(' ', value.strip())
+    return value.split(';')[0].split(',')[0].strip()
+
+def _search_sequential(kind, text):
+    """Try each pattern of kind in priority order, like the original extractors"""
+    for pattern in _SEQUENTIAL[kind]:
+        match = pattern.search(text)
+        if match:
+            value = _clean(match.group(1))
+            if value:
+                return value
+    return None
+
+def _scan(text):
+    """
+    Scan text once and return {'part': value, 'model': value} for the kinds found
+    """
+    best = {}  # kind -> (priority, raw value); earlier positions win ties
+    for keyword in _KEYWORDS.finditer(text):
+        match = _COMBINED.match(text, keyword.start())
+        if not match:
+            continue
+        kind, priority = match.lastgroup.rsplit('_', 1)
+        priority = int(priority)
+        if kind not in best or priority < best[kind][0]:
+            best[kind] = (priority, match.group(match.lastgroup))
+
+    found = {}
+    for kind, (priority, raw) in best.items():
+        value = _clean(raw)
+        # A blank value means the original search would fall through to the
+        # next pattern; replay the patterns one by one for that rare case
+        found[kind] = value or _search_sequential(kind, text)
+    return found
+
+def extract_part_number(text):
+    """Extract Part Number from text (code_info)"""
+    if not text:
+        return None
+    return _scan(text).get('part')
+
+def extract_model_catalog_number(text):
+    """Extract Model/Catalog Number from text (code_info or product_description)"""
+    if not text:
+        return None
+    return _scan(text).get('model')
+
+def extract_identifiers(code_info, description=None):
+    """
+    Extract both identifiers for one recall
+
+    The Part Number comes from code_info. The Model/Catalog Number comes
+    from code_info, falling back to the product description.
+
+    Returns:
+        (part_number, model_catalog_number) - either may be None
+    """
+    found = _scan(code_info) if code_info else {}
+    model = found.get('model')
+    if not model and description:
+        model = _scan(description).get('model')
+    return found.get('part'), model
+
+def extract_identifiers_batch(records):
+    """
+    Extract identifiers for a whole page of recalls in one call
+
+    Args:
+        records: Iterable of (code_info, description) pairs
+
+    Returns:
+        List of (part_number, model_catalog_number) tuples, in input order
+    """
+    return [extract_identifiers(code_info, description) for code_info, description in records]
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the openFDA device recall API and ERPNext check_inventory
+
+Serves synthetic recalls from /device/recall.json with the same paging
+(limit/skip), meta.results.total, 404-when-empty and skip cap behaviour as
+openFDA, and accepts inventory-check POSTs on /api/method/... like ERPNext.
+Records are generated on demand from their index, so totals in the
+millions cost no memory. Latency, 5xx errors and spurious 404s can be
+injected to exercise retries and resume.
+
+Run: python3 fake_fda_server.py [--total 100000] [--latency 0.05] [--error-rate 0.01]
+
+Then point the app at it:
+    FDA_RECALL_URL=http://127.0.0.1:8765/device/recall.json
+    ERPNEXT_URL=http://127.0.0.1:8765/api/method/recall_cross_reference.check_inventory
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_PORT = 8765
+DEFAULT_TOTAL = 50000
+DEFAULT_START = date(2002, 11, 1)
+SKIP_CAP = 25000  # openFDA rejects skip beyond this
+TERMINATED_AFTER = timedelta(days=90)
+TERMINATED_EVERY = 4  # every 4th recall has been terminated
+
+STATUSES = ('Open, Classified', 'Completed', 'Ongoing')
+FIRMS = ('Acme Surgical Inc', 'Medline Industries, LP', 'Stryker Corporation', 'Zimmer Biomet, Inc.',
+         'Becton Dickinson & Co.', 'Smith & Nephew, Inc.', 'Arthrex, Inc.')
+DEVICES = ('Bone screw, titanium, 4.5 mm', 'Surgical stapler, single use', 'Infusion pump',
+           'Knee implant tibial tray', 'Endoscope, flexible', 'Catheter, intravascular',
+           'Suture, absorbable', 'Orthopedic drill bit')
+REASONS = ('Packaging may be compromised, affecting sterility.',
+           'Labeling error: incorrect size printed on outer carton.',
+           'Device may fracture during use.',
+           'Software anomaly may cause incorrect dosage display.')
+
+class RecallDataset:
+    """Deterministic synthetic recalls, ordered by event_date_posted"""
+
+    def __init__(self, total=DEFAULT_TOTAL, start=DEFAULT_START, end=None):
+        self.total = total
+        self.start = start
+        self.days = max(((end or date.today()) - start).days, 1)
+
+    def posted(self, index):
+        return self.start + timedelta(days=index * self.days // self.total)
+
+    def record(self, index):
+        posted = self.posted(index)
+        rng = random.Random(index)
+        number = f"Z-{index:04d}-{posted.year}"
+        kind = index % 3
+        if kind == 0:
+            code_info = f"Model/Catalog Number: {rng.choice('ABCDEFGH')}{rng.randint(1000, 99999)}; Lot {rng.randint(100000, 999999)}"
+        elif kind == 1:
+            code_info = f"Part Number: P{rng.randint(10000, 999999)}-{rng.randint(1, 99):02d}, UDI-DI {rng.randint(10**13, 10**14 - 1)}"
+        else:
+            code_info = f"All lots. Expiration {posted.year + 3}-12-31"
+        record = {
+            'cfres_id': str(100000 + index),
+            'product_res_number': number,
+            'res_event_number': str(60000 + index // 3),
+            'product_description': f"{DEVICES[index % len(DEVICES)]} Model {rng.choice('XYZ')}{rng.randint(10, 999)}",
+            'code_info': code_info,
+            'event_date_posted': posted.strftime('%Y%m%d'),
+            'recall_status': STATUSES[index % len(STATUSES)],
+            'recalling_firm': FIRMS[index % len(FIRMS)],
+            'reason_for_recall': REASONS[index % len(REASONS)],
+            'product_code': ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ') for _ in range(3)),
+        }
+        if index % TERMINATED_EVERY == 0:
+            record['recall_status'] = 'Terminated'
+            record['event_date_terminated'] = (posted + TERMINATED_AFTER).strftime('%Y%m%d')
+        return record
+
+    def _first_posted_on_or_after(self, day):
+        """Lowest index whose event_date_posted is >= day (binary search)"""
+        lo, hi = 0, self.total
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.posted(mid) < day:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def search(self, expression):
+        """
+        Indices matching an openFDA search expression, as a range
+
+        Supports the forms the app uses: field:[YYYYMMDD TO YYYYMMDD] and
+        field:>YYYYMMDD for event_date_posted and event_date_terminated.
+        """
+        if not expression:
+            return range(self.total)
+        match = re.fullmatch(r'(\w+):(?:\[(\d{8})\s+TO\s+(\d{8}|\*)\]|>(\d{8}))', expression.strip())
+        if not match:
+            raise ValueError(f"Unsupported search: {expression}")
+        field, low, high, after = match.groups()
+        parse = lambda value: datetime.strptime(value, '%Y%m%d').date()
+        if after:
+            low_day, high_day = parse(after) + timedelta(days=1), None
+        else:
+            low_day, high_day = parse(low), (parse(high) if high != '*' else None)
+
+        shift = timedelta(0)
+        step = 1
+        if field == 'event_date_terminated':
+            shift, step = TERMINATED_AFTER, TERMINATED_EVERY
+        elif field != 'event_date_posted':
+            raise ValueError(f"Unsupported search field: {field}")
+
+        lo = self._first_posted_on_or_after(low_day - shift)
+        hi = self._first_posted_on_or_after(high_day - shift + timedelta(days=1)) if high_day else self.total
+        lo += -lo % step
+        return range(lo, max(hi, lo), step)
+
+def make_handler(dataset, latency=0.0, error_rate=0.0, not_found_rate=0.0,
+                 skip_cap=SKIP_CAP, match_rate=0.0, per_minute=None):
+    """Build a request handler class bound to a dataset and fault settings"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        stats = {'get': 0, 'post': 0, 'recalls_checked': 0, 'throttled': 0}
+        stats_lock = threading.Lock()
+        recent = []  # request times within the last minute, for per_minute throttling
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _inject_faults(self):
+            """Apply throttling, latency and random failures; returns True if a response was sent"""
+            if per_minute:
+                now = time.time()
+                with self.stats_lock:
+                    self.recent[:] = [t for t in self.recent if t > now - 60]
+                    throttled = len(self.recent) >= per_minute
+                    if throttled:
+                        self.stats['throttled'] += 1
+                        retry_after = int(self.recent[0] + 60 - now) + 1
+                    else:
+                        self.recent.append(now)
+                if throttled:
+                    payload = json.dumps({'error': {'code': 'OVER_RATE_LIMIT', 'message': 'API rate limit exceeded'}}).encode()
+                    self.send_response(429)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Retry-After', str(retry_after))
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return True
+            if latency:
+                time.sleep(latency)
+            if error_rate and random.random() < error_rate:
+                self._send_json(500, {'error': {'code': 'SERVER_ERROR', 'message': 'Injected failure'}})
+                return True
+            return False
+
+        def do_GET(self):
+            with self.stats_lock:
+                self.stats['get'] += 1
+            parts = urlsplit(self.path)
+            if not parts.path.endswith('/recall.json'):
+                return self._send_json(404, {'error': {'code': 'NOT_FOUND', 'message': 'Not found'}})
+            if self._inject_faults():
+                return
+
+            params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            try:
+                limit = int(params.get('limit', 1))
+                skip = int(params.get('skip', 0))
+                matches = dataset.search(params.get('search'))
+            except ValueError as e:
+                return self._send_json(400, {'error': {'code': 'BAD_REQUEST', 'message': str(e)}})
+            if skip > skip_cap or limit > 1000:
+                return self._send_json(400, {'error': {
+                    'code': 'BAD_REQUEST',
+                    'message': f'Skip value must be {skip_cap} or less.' if skip > skip_cap else 'Limit must be 1000 or less.'
+                }})
+
+            page = matches[skip:skip + limit]
+            if not page or (not_found_rate and random.random() < not_found_rate):
+                return self._send_json(404, {'error': {'code': 'NOT_FOUND', 'message': 'No matches found!'}})
+            self._send_json(200, {
+                'meta': {
+                    'disclaimer': 'Synthetic data from fake_fda_server.py',
+                    'last_updated': date.today().isoformat(),
+                    'results': {'skip': skip, 'limit': limit, 'total': len(matches)}
+                },
+                'results': [dataset.record(index) for index in page]
+            })
+
+        def do_POST(self):
+            with self.stats_lock:
+                self.stats['post'] += 1
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+            if not urlsplit(self.path).path.startswith('/api/method/'):
+                return self._send_json(404, {'exc_type': 'DoesNotExistError'})
+            if self._inject_faults():
+                return
+            try:
+                recalls = json.loads(body or b'{}').get('recalls') or []
+                if isinstance(recalls, str):
+                    recalls = json.loads(recalls)
+            except ValueError:
+                return self._send_json(417, {'exc_type': 'ValidationError', 'exception': 'Invalid JSON'})
+
+            with self.stats_lock:
+                self.stats['recalls_checked'] += len(recalls)
+            # Deterministic "inventory": a recall matches if its number hashes below match_rate
+            matches = [
+                {
+                    'recall_number': recall.get('recall_number'),
+                    'item_code': f"ITEM-{recall.get('product_code')}",
+                    'item_name': recall.get('device_name'),
+                    'match_type': 'product_code',
+                }
+                for recall in recalls
+                if zlib.crc32(str(recall.get('recall_number')).encode()) / 2**32 < match_rate
+            ]
+            self._send_json(200, {'message': {
+                'success': True,
+                'checked_count': len(recalls),
+                'matched_count': len(matches),
+                'matches': matches,
+            }})
+
+    return Handler
+
+def serve(port=DEFAULT_PORT, host='127.0.0.1', total=DEFAULT_TOTAL, start=DEFAULT_START, end=None,
+          latency=0.0, error_rate=0.0, not_found_rate=0.0, skip_cap=SKIP_CAP, match_rate=0.0,
+          per_minute=None):
+    """
+    Start the fake server on a background thread
+
+    Returns:
+        The ThreadingHTTPServer; call shutdown() to stop it
+    """
+    dataset = RecallDataset(total=total, start=start, end=end)
+    handler = make_handler(dataset, latency=latency, error_rate=error_rate,
+                           not_found_rate=not_found_rate, skip_cap=skip_cap, match_rate=match_rate,
+                           per_minute=per_minute)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    threading.Thread(target=server.serve_forever, name='fake-fda-server', daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local fake openFDA/ERPNext server for load testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--total', type=int, default=DEFAULT_TOTAL,
+                        help=f"Number of synthetic recalls (default {DEFAULT_TOTAL})")
+    parser.add_argument('--start', type=date.fromisoformat, default=DEFAULT_START,
+                        help="First event_date_posted (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, default=None,
+                        help="Last event_date_posted (default today)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 500")
+    parser.add_argument('--not-found-rate', type=float, default=0.0,
+                        help="Fraction of recall pages answered with a spurious 404")
+    parser.add_argument('--skip-cap', type=int, default=SKIP_CAP,
+                        help=f"Largest skip accepted before HTTP 400 (default {SKIP_CAP})")
+    parser.add_argument('--match-rate', type=float, default=0.0,
+                        help="Fraction of recalls reported as inventory matches")
+    parser.add_argument('--per-minute', type=int, default=None,
+                        help="Answer 429 with Retry-After beyond this many requests per minute")
+    args = parser.parse_args()
+
+    server = serve(port=args.port, host=args.host, total=args.total, start=args.start, end=args.end,
+                   latency=args.latency, error_rate=args.error_rate, not_found_rate=args.not_found_rate,
+                   skip_cap=args.skip_cap, match_rate=args.match_rate, per_minute=args.per_minute)
+    base = f"http://{args.host}:{args.port}"
+    print(f"Serving {args.total} synthetic recalls on {base}")
+    print(f"  FDA_RECALL_URL={base}/device/recall.json")
+    print(f"  ERPNEXT_URL={base}/api/method/recall_cross_reference.check_inventory")
+    print("Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Requests served: {server.stats}")
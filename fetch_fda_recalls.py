@@ -5,17 +5,41 @@ Fetches recalls from FDA API and stores in database
 import requests
 import re
 import json
-from datetime import datetime
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from database import db
-from models import FDADeviceRecall, RecallCheckHistory
+from models import FDADeviceRecall, RecallCheckHistory, IngestCheckpoint, IngestState
+from recall_store import content_hash, safe_upsert_recalls, update_changed_recalls
+from extraction import extract_identifiers_batch
+from erpnext_dispatch import enqueue_inserted_recalls
+from http_archive import mount_archive
+from rate_limit import FDA_API_KEY, get_fda_rate_limiter
+from run_timings import RunTimings
+from metrics import INGEST_PAGES, INGEST_RECORDS, record_ingest_run
+# Re-exported for scripts that import the extractors from this module
+from extraction import extract_part_number, extract_model_catalog_number
 
-FDA_RECALL_URL = "https://api.fda.gov/device/recall.json"
+FDA_RECALL_URL = os.environ.get('FDA_RECALL_URL', "https://api.fda.gov/device/recall.json")
 BATCH_SIZE = 1000  # max per request
-
-# ERPNext Configuration
-ERPNEXT_URL = "https://beta.surgi.shop/api/method/recall_cross_reference.check_inventory"
-ERPNEXT_API_KEY = "ae0d7bdc5c61e8b"
-ERPNEXT_API_SECRET = "c637ae040a3eae7"
+MAX_SKIP = 10000  # Safety limit to prevent infinite loops
+# Attempts per page before the run is aborted (the page is never skipped)
+FDA_MAX_RETRIES = int(os.environ.get('FDA_MAX_RETRIES', 6))
+FDA_RETRY_BASE_SECONDS = 1.0
+FDA_RETRY_MAX_SECONDS = 120.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Number of pages requested from openFDA in parallel
+FDA_FETCH_WORKERS = int(os.environ.get('FDA_FETCH_WORKERS', 4))
+# Commit (and checkpoint) after at least this many records; rounded up to whole pages
+INGEST_COMMIT_EVERY = int(os.environ.get('INGEST_COMMIT_EVERY', 1000))
+# Days before the stored watermark re-queried on every run, for records FDA posts late
+INGEST_OVERLAP_DAYS = int(os.environ.get('INGEST_OVERLAP_DAYS', 3))
+# Days of recently posted/terminated recalls re-pulled on every run to pick up changes
+INGEST_LOOKBACK_DAYS = int(os.environ.get('INGEST_LOOKBACK_DAYS', 30))
 
 def scrub(text):
     """Convert text to lowercase, replace spaces with underscores, remove non-alphanum"""
@@ -26,61 +50,6 @@ def scrub(text):
     text = re.sub(r'[^a-z0-9_-]', '', text)
     return text
 
-def extract_part_number(text):
-    """Extract Part Number from text (code_info)"""
-    if not text:
-        return None
-    
-    # Look for "Part Number" or variations
-    # Pattern: "Part Number: 6000-390-000" or "Part Number 6000-390-000"
-    patterns = [
-        r'Part Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Part[:\s]+Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Part\s*#\s*[:\s]*([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-        if match:
-            part_number = match.group(1).strip()
-            # Clean up - remove extra whitespace, newlines
-            part_number = re.sub(r'\s+', ' ', part_number)
-            # Take first part before semicolon or comma if present
-            part_number = part_number.split(';')[0].split(',')[0].strip()
-            if part_number:
-                return part_number
-    
-    return None
-
-def extract_model_catalog_number(text):
-    """Extract Model/Catalog Number from text (code_info or product_description)"""
-    if not text:
-        return None
-    
-    # Look for "Model/Catalog Number" or variations
-    # Pattern: "Model/Catalog Number: HX-400U-30" or "Model/Catalog Number HX-400U-30"
-    # Include lowercase letters in the pattern (A-Za-z0-9)
-    patterns = [
-        r'Model/Catalog Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Model/Catalog[:\s]+Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Catalog Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Model Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Model[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-        if match:
-            model_number = match.group(1).strip()
-            # Clean up - remove extra whitespace, newlines
-            model_number = re.sub(r'\s+', ' ', model_number)
-            # Take first part before semicolon or comma if present
-            model_number = model_number.split(';')[0].split(',')[0].strip()
-            if model_number:
-                return model_number
-    
-    return None
-
 def parse_date(date_str):
     """Parse FDA date string to datetime object"""
     if not date_str:
@@ -99,237 +68,495 @@ def parse_date(date_str):
     except Exception:
         return None
 
-def send_recalls_to_erpnext(recalls_list):
+def _build_recall_row(item, part_number, model_catalog_number):
+    """Map one openFDA result and its extracted identifiers to FDADeviceRecall column values"""
+    recall_number = item.get("product_res_number")
+    device_name = item.get("product_description") or "Unknown Device"
+    
+    # Use Part Number as product_code if found (primary), 
+    # then Model/Catalog Number, otherwise fall back to cfres_id
+    product_code = part_number or model_catalog_number or item.get("cfres_id")
+
+    # Parse recall date
+    event_date = item.get("event_date_posted")
+    recall_date = parse_date(event_date) if event_date else None
+
+    # Note: code_info is stored in full (up to 140 chars) to preserve Model/Catalog Number
+    code_info_full = item.get("code_info")
+    row = {
+        'name': f"{scrub(device_name)}-{recall_number}",
+        'recall_number': recall_number,
+        'device_name': (device_name[:140] if device_name else None),
+        'product_code': product_code[:100] if product_code else None,  # Limit to 100 chars for product_code field
+        'recall_date': recall_date,
+        'reason': (item.get("reason_for_recall")[:140] if item.get("reason_for_recall") else None),
+        'status': item.get("recall_status"),
+        'recall_firm': item.get("recalling_firm"),
+        'code_info': (code_info_full[:140] if code_info_full else None)
+    }
+    row['content_hash'] = content_hash(row)
+    return row
+
+def build_recall_rows(items):
     """
-    Send newly fetched recalls to ERPNext for inventory cross-reference
+    Map a page of openFDA results to FDADeviceRecall column values
+    
+    Part Number comes from code_info; Model/Catalog Number comes from
+    code_info with product_description as the fallback. Identifiers for
+    the whole page are extracted in one batch call.
+    """
+    identifiers = extract_identifiers_batch(
+        (item.get("code_info") or "", item.get("product_description") or "Unknown Device")
+        for item in items
+    )
+    return [
+        _build_recall_row(item, part_number, model_catalog_number)
+        for item, (part_number, model_catalog_number) in zip(items, identifiers)
+    ]
+
+_fda_session = None
+_fda_session_lock = threading.Lock()
+
+def get_fda_session():
+    """Return the shared keep-alive session used for all openFDA requests"""
+    global _fda_session
+    with _fda_session_lock:
+        if _fda_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=max(FDA_FETCH_WORKERS, 1)
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # Record or replay traffic when HTTP_ARCHIVE_MODE is set
+            mount_archive(session, pool_connections=1, pool_maxsize=max(FDA_FETCH_WORKERS, 1))
+            _fda_session = session
+        return _fda_session
+
+def _retry_after(response):
+    """Seconds requested by a Retry-After header, or None"""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(tz=timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def _fetch_page(session, url, search, skip, limit=BATCH_SIZE, timings=None, end_on_404=True):
+    """
+    Fetch a single page of recalls
+    
+    Every attempt waits for the shared rate limiter. Rate limiting (429),
+    server errors and connection failures are retried on the same page
+    with exponential backoff and jitter, honouring Retry-After; a 429 also
+    pauses every other client sharing the limiter.
     
     Args:
-        recalls_list: List of recall dictionaries to check against inventory
-        
+        timings: Optional RunTimings that is charged the JSON decode time and
+            counts the page and its size
+        end_on_404: Treat 404 as "no more results". Pass False for a page
+            inside the reported total, where a 404 can only be a transient
+            error and is retried like a 5xx.
+    
     Returns:
-        dict with response from ERPNext or error info
+        Decoded JSON response, or None when the API answers 404 and end_on_404 is set
+    
+    Raises:
+        requests.exceptions.RequestException: once FDA_MAX_RETRIES attempts have failed
     """
-    if not recalls_list:
-        return {"success": False, "message": "No recalls to send"}
+    # A fixed sort order keeps skip offsets stable so a run can resume
+    params = {"limit": limit, "skip": skip, "sort": "event_date_posted:asc"}
+    if search:
+        params['search'] = search
+    if FDA_API_KEY:
+        params['api_key'] = FDA_API_KEY
+    limiter = get_fda_rate_limiter()
     
-    try:
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'token {ERPNEXT_API_KEY}:{ERPNEXT_API_SECRET}'
-        }
-        
-        # Format recalls for ERPNext API
-        formatted_recalls = []
-        for recall in recalls_list:
-            formatted_recalls.append({
-                'id': recall.get('id'),
-                'recall_number': recall.get('recall_number'),
-                'device_name': recall.get('device_name'),
-                'product_code': recall.get('product_code'),
-                'code_info': recall.get('code_info'),
-                'recall_date': recall.get('recall_date').isoformat() if recall.get('recall_date') else None,
-                'status': recall.get('status'),
-                'reason': recall.get('reason')
-            })
-        
-        response = requests.post(
-            ERPNEXT_URL,
-            headers=headers,
-            json={'recalls': formatted_recalls},  # Send as list, not JSON string
-            timeout=60
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✓ ERPNext check complete: {result.get('message', {}).get('matched_count', 0)} matches found")
-            return result
+    for attempt in range(1, FDA_MAX_RETRIES + 1):
+        limiter.acquire()
+        response = None
+        try:
+            response = session.get(url, params=params, timeout=30)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
         else:
-            error_msg = f"ERPNext API error {response.status_code}: {response.text}"
-            print(f"✗ {error_msg}")
-            return {"success": False, "error": error_msg}
-            
-    except Exception as e:
-        error_msg = f"Error sending to ERPNext: {str(e)}"
-        print(f"✗ {error_msg}")
-        return {"success": False, "error": error_msg}
+            # Handle 404 - means no more results available
+            if response.status_code == 404 and end_on_404:
+                return None
+            if response.status_code not in RETRY_STATUS_CODES and response.status_code != 404:
+                # Other HTTP errors (e.g. 400 for a bad query) will not fix themselves
+                response.raise_for_status()
+                start = time.perf_counter()
+                data = response.json()
+                if timings:
+                    timings.add('decode', time.perf_counter() - start)
+                    timings.add_page(len(response.content))
+                return data
+            error = requests.exceptions.HTTPError(
+                f"{response.status_code} {response.reason} for url: {response.url}", response=response
+            )
+
+        if attempt == FDA_MAX_RETRIES:
+            raise error
+        delay = _retry_after(response)
+        if delay is None:
+            delay = min(FDA_RETRY_BASE_SECONDS * 2 ** (attempt - 1), FDA_RETRY_MAX_SECONDS)
+            delay *= random.uniform(0.5, 1.5)
+        if response is not None and response.status_code == 429:
+            limiter.pause(delay)
+        print(f"Request error at skip={skip} (attempt {attempt}/{FDA_MAX_RETRIES}), "
+              f"retrying in {delay:.1f}s: {error}")
+        time.sleep(delay)
+
+def probe_fda_results(search=None, url=None, timings=None):
+    """
+    Read meta.results.total and meta.last_updated for a query with a single limit=1 request
+    
+    Returns:
+        (total, last_updated) - total is 0 when the API answers 404
+    """
+    data = _fetch_page(get_fda_session(), url or FDA_RECALL_URL, search, 0, limit=1, timings=timings)
+    if data is None:
+        return 0, None
+    meta = data.get("meta", {})
+    return meta.get("results", {}).get("total", 0), meta.get("last_updated")
+
+def count_fda_results(search=None, url=None):
+    """
+    Return meta.results.total for a query using a single limit=1 request
+    
+    Returns:
+        Number of matching records (0 when the API answers 404)
+    """
+    return probe_fda_results(search, url)[0]
+
+def iter_fda_pages(search=None, start_skip=0, workers=None, max_skip=MAX_SKIP, url=None, timings=None):
+    """
+    Yield (skip, results) for each page of a query, in offset order
+    
+    The first page is fetched on its own to learn meta.results.total; the
+    remaining offsets are then requested concurrently over the shared
+    session, and yielded in order as they complete.
+    
+    Args:
+        search: openFDA search expression, or None for all records
+        start_skip: Offset of the first page to fetch
+        workers: Number of concurrent requests (default FDA_FETCH_WORKERS)
+        max_skip: Offset at which paging stops
+        url: Endpoint to query (default FDA_RECALL_URL)
+        timings: Optional RunTimings passed to every page request
+    
+    Raises:
+        requests.exceptions.RequestException: when a page still fails after its retries
+    """
+    session = get_fda_session()
+    url = url or FDA_RECALL_URL
+    workers = max(workers or FDA_FETCH_WORKERS, 1)
+    skip = start_skip
+    total = None
+
+    # Fetch the first page on its own to learn the total
+    if skip < max_skip:
+        data = _fetch_page(session, url, search, skip, timings=timings)
+        if data is None:
+            print(f"404 error at skip={skip} - no more results available")
+            return
+        results = data.get("results", [])
+        if not results:
+            print(f"No more results at skip={skip}")
+            return
+
+        # Without a reported total, keep paging until the API runs dry
+        reported_total = data.get("meta", {}).get("results", {}).get("total")
+        total = reported_total or max_skip
+        yield skip, results
+        skip += BATCH_SIZE
+
+    offsets = list(range(skip, min(total or 0, max_skip), BATCH_SIZE))
+    if not offsets:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    # Every offset is inside a reported total, so a 404 there is an error, not the end of the data
+    futures = [executor.submit(_fetch_page, session, url, search, offset, timings=timings,
+                               end_on_404=not reported_total)
+               for offset in offsets]
+    try:
+        for offset, future in zip(offsets, futures):
+            # A page that still fails after its retries ends the run; the caller's
+            # checkpoint then resumes from it instead of silently losing its records
+            data = future.result()
+            if data is None:
+                print(f"404 error at skip={offset} - no more results available")
+                return
+            results = data.get("results", [])
+            if not results:
+                print(f"No more results at skip={offset}")
+                return
 
-def fetch_fda_recalls():
-    """Fetch FDA recalls from API and store in database"""
+            yield offset, results
+    finally:
+        # Don't wait on pages nobody will consume
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def start_checkpoint(source, search):
+    """
+    Resume the unfinished checkpoint for source, or start a new one for search
+    
+    Returns:
+        (checkpoint, skip offset of the next page to fetch)
+    """
+    checkpoint = IngestCheckpoint.query.filter_by(
+        source=source, completed=False
+    ).order_by(IngestCheckpoint.id.desc()).first()
+    
+    if checkpoint and checkpoint.last_skip is not None:
+        print(f"Resuming {source} run for '{checkpoint.search}' after skip={checkpoint.last_skip}")
+        return checkpoint, checkpoint.last_skip + BATCH_SIZE
+    
+    if not checkpoint:
+        checkpoint = IngestCheckpoint(source=source, search=search)
+        db.session.add(checkpoint)
+    else:
+        checkpoint.search = search
+    db.session.commit()
+    return checkpoint, 0
+
+def record_checkpoint(checkpoint, skip, results, written):
+    """Record a processed page on the checkpoint; committed with the page's rows"""
+    posted = [parse_date(item.get("event_date_posted")) for item in results]
+    posted = [d for d in posted if d]
+    checkpoint.last_skip = skip
+    if posted and (not checkpoint.last_event_date_posted or max(posted) > checkpoint.last_event_date_posted):
+        checkpoint.last_event_date_posted = max(posted)
+    checkpoint.records_written = (checkpoint.records_written or 0) + written
+
+def get_ingest_state(source, field='event_date_posted'):
+    """Return the IngestState row for source/field, creating it on first use"""
+    state = IngestState.query.filter_by(source=source, field=field).first()
+    if not state:
+        state = IngestState(source=source, field=field)
+        if field == 'event_date_posted':
+            # First run after upgrading: seed from the data we already have
+            state.watermark = db.session.query(db.func.max(FDADeviceRecall.recall_date)).scalar()
+        db.session.add(state)
+        db.session.commit()
+    return state
+
+def probe_unchanged(state, search, probe):
+    """True if a search's probe matches what the last completed run of it saw"""
+    total, last_updated = probe
+    return (state.last_search == search and state.last_total == total
+            and state.last_updated == last_updated)
+
+def record_probe(state, search, probe):
+    """Remember the probe a completed run of search started from"""
+    state.last_search = search
+    state.last_total, state.last_updated = probe
+    db.session.commit()
+
+def advance_watermark(state, watermark):
+    """Move the watermark forward after a successful run; never moves it back"""
+    if watermark and (not state.watermark or watermark > state.watermark):
+        state.watermark = watermark
+    state.last_success_at = datetime.now()
+    db.session.commit()
+
+def fetch_fda_recalls(workers=None, progress=None, force=False):
+    """
+    Fetch FDA recalls from API and store in database
+    
+    Args:
+        workers: Number of pages to request concurrently (default FDA_FETCH_WORKERS)
+        progress: Optional callable(stage=None, pages=0, seen=0, inserted=0, updated=0),
+            called when a stage starts and after each page is written
+        force: Run the full fetch even if the freshness probe reports no changes
+    """
     from flask import has_app_context, current_app
     
     # If we're already in an app context (e.g., called from a route), use it
     # Otherwise, create a new one
     if has_app_context():
-        return _fetch_fda_recalls()
+        return _fetch_fda_recalls(workers, progress, force)
     else:
         from app import app
         with app.app_context():
-            return _fetch_fda_recalls()
+            return _fetch_fda_recalls(workers, progress, force)
 
-def _fetch_fda_recalls():
-    """Internal function that does the actual fetching"""
-    new_recalls_for_erpnext = []  # Track new recalls to send to ERPNext
+def ingest_search(source, search, workers=None, progress=None, timings=None):
+    """
+    Fetch every page of one openFDA search and write it to the database
     
-    try:
-        # Step 1: get the latest recall date we already have
-        last_recall = FDADeviceRecall.query.order_by(
-            FDADeviceRecall.recall_date.desc()
-        ).first()
-        
-        last_date = last_recall.recall_date if last_recall else None
+    New recalls are inserted and queued for ERPNext; recalls we already
+    have are rewritten only when their content hash changed. Progress is
+    checkpointed under source, so an interrupted run resumes its search.
+    Time spent in each stage is added to timings, if given.
+    
+    Returns:
+        (new recalls inserted, existing recalls updated, latest event_date_posted seen,
+         the search that was run - an interrupted run's, if one was resumed)
+    """
+    # Pick up where an interrupted run left off, if there is one
+    checkpoint, start_skip = start_checkpoint(source, search)
+    search = checkpoint.search
+    timings = timings or RunTimings()
+    total_fetched = 0
+    total_updated = 0
+    uncommitted = 0
 
-        # If no recalls exist yet, start from Jan 1, 2024
-        if not last_date:
-            last_date = datetime(2024, 1, 1).date()
+    pages = iter_fda_pages(search, start_skip=start_skip, workers=workers, timings=timings)
+    for skip, results in timings.timed(pages, 'http'):
+        timings.records += len(results)
+        with timings.stage('extract'):
+            page_rows = build_recall_rows(results)
+        # One bulk statement per page; the database skips recalls we already have
+        with timings.stage('write'):
+            inserted = safe_upsert_recalls(page_rows)
+        total_fetched += len(inserted)
 
-        total_fetched = 0
-        skip = 0
-        max_skip = 10000  # Safety limit to prevent infinite loops
-        consecutive_errors = 0
-        max_consecutive_errors = 3
+        # Existing recalls: one bulk UPDATE for those FDA has changed since we stored them
+        with timings.stage('dedup'):
+            updated = update_changed_recalls([row for row in page_rows if row['recall_number'] not in inserted])
+        total_updated += len(updated)
 
-        while skip < max_skip:
-            params = {"limit": BATCH_SIZE, "skip": skip}
+        # Queue new recalls for the ERPNext inventory check in the same
+        # transaction, so a committed recall is never missing from the outbox
+        with timings.stage('write'):
+            queued = enqueue_inserted_recalls(results, page_rows, inserted)
 
-            if last_date:
-                # FDA API uses YYYYMMDD format for dates
-                params['search'] = f"event_date_posted:>{last_date.strftime('%Y%m%d')}"
+        record_checkpoint(checkpoint, skip, results, queued + len(updated))
+        if progress:
+            progress(pages=1, seen=len(results), inserted=queued, updated=len(updated))
+        INGEST_PAGES.labels(source).inc()
+        INGEST_RECORDS.labels(source, 'seen').inc(len(results))
+        INGEST_RECORDS.labels(source, 'inserted').inc(queued)
+        INGEST_RECORDS.labels(source, 'updated').inc(len(updated))
+        uncommitted += len(page_rows)
+        if uncommitted >= INGEST_COMMIT_EVERY:
+            with timings.stage('write'):
+                db.session.commit()
+            uncommitted = 0
 
-            try:
-                response = requests.get(FDA_RECALL_URL, params=params, timeout=30)
-                
-                # Handle 404 - means no more results available
-                if response.status_code == 404:
-                    print(f"404 error at skip={skip} - no more results available")
-                    break
-                
-                # Handle other HTTP errors
-                response.raise_for_status()
-                
-                data = response.json()
-                results = data.get("results", [])
-                
-                # Reset error counter on success
-                consecutive_errors = 0
-
-                if not results:
-                    print(f"No more results at skip={skip}")
-                    break
-                    
-            except requests.exceptions.HTTPError as e:
-                consecutive_errors += 1
-                if consecutive_errors >= max_consecutive_errors:
-                    print(f"Too many consecutive errors ({consecutive_errors}), stopping fetch")
-                    break
-                print(f"HTTP error at skip={skip}: {e}")
-                skip += BATCH_SIZE
-                continue
-            except requests.exceptions.RequestException as e:
-                consecutive_errors += 1
-                if consecutive_errors >= max_consecutive_errors:
-                    print(f"Too many consecutive errors ({consecutive_errors}), stopping fetch")
-                    break
-                print(f"Request error at skip={skip}: {e}")
-                skip += BATCH_SIZE
-                continue
+    checkpoint.completed = True
+    with timings.stage('write'):
+        db.session.commit()
+    return total_fetched, total_updated, checkpoint.last_event_date_posted, search
+
+def ingest_search_to_date(source, search, workers=None, progress=None, timings=None):
+    """
+    Run ingest_search, and search itself again if that only finished an older run
+    
+    A resumed checkpoint carries the search of the run that was
+    interrupted, whose date window may end before today's; without the
+    second pass the gap would never be fetched once search's probe is
+    recorded as done.
+    
+    Returns:
+        (new recalls inserted, existing recalls updated, latest event_date_posted seen)
+    """
+    inserted, updated, latest_posted, ran = ingest_search(source, search, workers, progress, timings)
+    if ran != search:
+        print(f"Finished interrupted {source} run for '{ran}'; now fetching '{search}'")
+        more_inserted, more_updated, more_posted, ran = ingest_search(source, search, workers, progress, timings)
+        inserted += more_inserted
+        updated += more_updated
+        latest_posted = max(filter(None, (latest_posted, more_posted)), default=None)
+    return inserted, updated, latest_posted
+
+def _fetch_fda_recalls(workers=None, progress=None, force=False):
+    """Internal function that does the actual fetching"""
+    timings = RunTimings()
+    try:
+        # Step 1: where the last successful run got to
+        state = get_ingest_state('fetch')
+        refresh_state = get_ingest_state('refresh', 'event_date_terminated')
 
-            for item in results:
-                recall_number = item.get("product_res_number")
-                device_name = item.get("product_description") or "Unknown Device"
-                code_info = item.get("code_info") or ""
-                
-                # Extract Part Number from code_info first (primary source for product_code)
-                part_number = extract_part_number(code_info)
-                
-                # Extract Model/Catalog Number from code_info as fallback, 
-                # then fall back to product_description
-                model_catalog_number = extract_model_catalog_number(code_info)
-                if not model_catalog_number:
-                    model_catalog_number = extract_model_catalog_number(device_name)
-                
-                # Use Part Number as product_code if found (primary), 
-                # then Model/Catalog Number, otherwise fall back to cfres_id
-                product_code = part_number or model_catalog_number or item.get("cfres_id")
-
-                doc_name = f"{scrub(device_name)}-{recall_number}"
-
-                # Skip if already exists (use no_autoflush to avoid premature flush errors)
-                with db.session.no_autoflush:
-                    existing = FDADeviceRecall.query.filter_by(name=doc_name).first()
-                    if existing:
-                        continue
-
-                # Parse recall date
-                event_date = item.get("event_date_posted")
-                recall_date = parse_date(event_date) if event_date else None
-
-                # Create new recall record
-                # Note: code_info is stored in full (up to 140 chars) to preserve Model/Catalog Number
-                code_info_full = item.get("code_info")
-                recall = FDADeviceRecall(
-                    name=doc_name,
-                    recall_number=recall_number,
-                    device_name=(device_name[:140] if device_name else None),
-                    product_code=product_code[:100] if product_code else None,  # Limit to 100 chars for product_code field
-                    recall_date=recall_date,
-                    reason=(item.get("reason_for_recall")[:140] if item.get("reason_for_recall") else None),
-                    status=item.get("recall_status"),
-                    recall_firm=item.get("recalling_firm"),
-                    code_info=(code_info_full[:140] if code_info_full else None)
-                )
-
-                db.session.add(recall)
-                total_fetched += 1
-                
-                # Add to list for ERPNext checking
-                new_recalls_for_erpnext.append({
-                    'id': recall.id,
-                    'recall_number': recall_number,
-                    'device_name': device_name,
-                    'product_code': product_code,
-                    'code_info': code_info_full,
-                    'recall_date': recall_date,
-                    'status': item.get("recall_status"),
-                    'reason': item.get("reason_for_recall")
-                })
-
-            skip += BATCH_SIZE
+        # If no recalls exist yet, start from Jan 1, 2024
+        watermark = state.watermark or date(2024, 1, 1)
 
-        db.session.commit()
-        
-        # Send new recalls to ERPNext for inventory checking
-        result_message = f"Imported {total_fetched} new recall records"
-        inventory_checked = False
-        matches_found = 0
+        # Inclusive range starting a few days before the watermark, so records
+        # FDA posts late for a day we already covered are still picked up.
+        # The look-back window is re-pulled too, so recent recalls pick up FDA's changes
+        today = date.today()
+        lookback_start = today - timedelta(days=INGEST_LOOKBACK_DAYS)
+        since = min(watermark - timedelta(days=INGEST_OVERLAP_DAYS), lookback_start)
+        # FDA API uses YYYYMMDD format for dates
+        posted_search = f"event_date_posted:[{since.strftime('%Y%m%d')} TO {today.strftime('%Y%m%d')}]"
+        # Older recalls that were terminated recently are outside that window
+        terminated_search = f"event_date_terminated:>{lookback_start.strftime('%Y%m%d')}"
+
+        # Step 2: cheap limit=1 probes; skip the run if openFDA has nothing new for either search
+        if progress:
+            progress(stage='Checking openFDA for changes')
+        posted_probe = probe_fda_results(posted_search, timings=timings)
+        terminated_probe = probe_fda_results(terminated_search, timings=timings)
+        interrupted = IngestCheckpoint.query.filter(
+            IngestCheckpoint.source.in_(('fetch', 'refresh')), IngestCheckpoint.completed.is_(False)
+        ).count()
+        if (not force and not interrupted
+                and probe_unchanged(state, posted_search, posted_probe)
+                and probe_unchanged(refresh_state, terminated_search, terminated_probe)):
+            result_message = (f"No changes on openFDA since the last fetch "
+                              f"(last updated {posted_probe[1]}, {posted_probe[0]} records in window); skipped")
+            print(result_message)
+            db.session.add(timings.apply(RecallCheckHistory(
+                check_date=datetime.now(),
+                new_recalls_count=0,
+                inventory_checked=False,
+                matches_found=0,
+                notes=result_message[:500]
+            )))
+            db.session.commit()
+            record_ingest_run('unchanged', timings)
+            return result_message
+
+        if progress:
+            progress(stage='Fetching new recalls')
+        total_fetched, total_updated, latest_posted = ingest_search_to_date(
+            'fetch', posted_search, workers, progress, timings)
+        advance_watermark(state, latest_posted)
+        record_probe(state, posted_search, posted_probe)
+
+        if progress:
+            progress(stage='Refreshing recently terminated recalls')
+        terminated = ingest_search_to_date('refresh', terminated_search, workers, progress, timings)
+        record_probe(refresh_state, terminated_search, terminated_probe)
+        total_fetched += terminated[0]
+        total_updated += terminated[1]
+        queued = total_fetched
         
-        if new_recalls_for_erpnext:
-            print(f"\n→ Sending {len(new_recalls_for_erpnext)} new recalls to ERPNext for inventory checking...")
-            erpnext_result = send_recalls_to_erpnext(new_recalls_for_erpnext)
-            inventory_checked = True
-            
-            if erpnext_result.get('success'):
-                matches_found = erpnext_result.get('message', {}).get('matched_count', 0)
-                result_message += f"\nERPNext: {matches_found} inventory matches found"
-            else:
-                result_message += f"\nERPNext check failed: {erpnext_result.get('error', 'Unknown error')}"
+        result_message = f"Imported {total_fetched} new recall records, updated {total_updated} changed records"
+        if queued:
+            # Sent by the dispatcher once the fetch job has finished; the scheduler retries anything left over
+            print(f"\n→ Queued {queued} new recalls for ERPNext inventory checking")
+            result_message += f"\nQueued {queued} recalls for ERPNext inventory check"
         else:
             print("No new recalls to send to ERPNext")
+        print(f"Fetch timing: {timings.summary()}")
         
-        # Log this check to history
-        history = RecallCheckHistory(
+        # Log this check to history, with the run's timing and throughput
+        history = timings.apply(RecallCheckHistory(
             check_date=datetime.now(),
             new_recalls_count=total_fetched,
-            inventory_checked=inventory_checked,
-            matches_found=matches_found,
+            inventory_checked=False,
+            matches_found=0,
             notes=result_message[:500] if result_message else None
-        )
+        ))
         db.session.add(history)
         db.session.commit()
+        record_ingest_run('success', timings)
         
         return result_message
 
     except Exception as e:
         db.session.rollback()
+        record_ingest_run('error', timings)
         import traceback
         error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)  # Log to console
@@ -0,0 +1,142 @@
+"""
+Background fetch jobs
+/fetch starts a fetch on a background thread and returns immediately
+with a job id; progress is written to the fetch_job table as pages are
+processed, for /api/jobs/<id> to report. Only one fetch can be queued or
+running at a time: the row holds a unique active_key while it is live,
+so a second trigger gets the in-flight job back instead of starting
+another fetch. refetch_all_recalls holds the same slot while it rebuilds
+the table.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import FetchJob
+
+ACTIVE_KEY = 'fetch'
+# A live job with no progress for this long is assumed to have died with its worker
+STALE_AFTER = timedelta(minutes=30)
+
+class JobProgress:
+    """Progress callback for fetch_fda_recalls that records counts on a FetchJob"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, stage=None, pages=0, seen=0, inserted=0, updated=0):
+        # Written through the fetch's own session, so counts are committed with the pages
+        job = self.job
+        if stage:
+            job.stage = stage
+        job.pages_done = (job.pages_done or 0) + pages
+        job.records_seen = (job.records_seen or 0) + seen
+        job.records_inserted = (job.records_inserted or 0) + inserted
+        job.records_updated = (job.records_updated or 0) + updated
+        job.updated_at = datetime.now()
+        if stage:
+            db.session.commit()
+
+def _release_stale_job():
+    """Free the active slot if its job stopped making progress"""
+    stale = FetchJob.query.filter(
+        FetchJob.active_key == ACTIVE_KEY,
+        FetchJob.updated_at < datetime.now() - STALE_AFTER
+    ).first()
+    if stale:
+        stale.status = 'failed'
+        stale.message = 'Abandoned: no progress reported'
+        stale.active_key = None
+        stale.finished_at = datetime.now()
+        db.session.commit()
+
+def fetch_in_progress():
+    """True if a fetch job is queued or running (and still reporting progress)"""
+    return FetchJob.query.filter(
+        FetchJob.active_key == ACTIVE_KEY,
+        FetchJob.updated_at >= datetime.now() - STALE_AFTER
+    ).first() is not None
+
+def create_fetch_job(trigger='manual'):
+    """
+    Register a new fetch job, or return the one already in flight
+
+    Returns:
+        (job, created) - created is False when the trigger was merged
+        into an existing queued or running job
+    """
+    _release_stale_job()
+    try:
+        job = FetchJob(trigger=trigger, active_key=ACTIVE_KEY, status='queued', stage='Queued')
+        db.session.add(job)
+        db.session.commit()
+        return job, True
+    except IntegrityError:
+        db.session.rollback()
+        existing = FetchJob.query.filter_by(active_key=ACTIVE_KEY).first()
+        if existing is None:
+            # It finished between our insert and this lookup; try once more
+            return create_fetch_job(trigger)
+        return existing, False
+
+def run_fetch_job(job_id, force=False):
+    """Run a queued fetch job to completion; must be called inside an app context"""
+    from fetch_fda_recalls import fetch_fda_recalls
+
+    job = db.session.get(FetchJob, job_id)
+    job.status = 'running'
+    job.stage = 'Starting'
+    job.started_at = datetime.now()
+    db.session.commit()
+
+    try:
+        result = fetch_fda_recalls(progress=JobProgress(job), force=force)
+        failed = str(result).startswith('Error')
+    except Exception as e:
+        db.session.rollback()
+        result = f"Error: {e}"
+        failed = True
+
+    finish_fetch_job(job_id, result, failed)
+    # Send the recalls it queued only now, so ERPNext never holds up the job
+    from erpnext_dispatch import start_dispatch
+    start_dispatch()
+    return result
+
+def finish_fetch_job(job_id, result, failed=False):
+    """Record the outcome of a job and free the active slot for the next fetch"""
+    job = db.session.get(FetchJob, job_id)
+    job.status = 'failed' if failed else 'succeeded'
+    job.stage = 'Failed' if failed else 'Done'
+    job.message = str(result)[:500]
+    job.active_key = None
+    job.finished_at = datetime.now()
+    db.session.commit()
+
+def _run_in_thread(app, job_id, force=False):
+    with app.app_context():
+        try:
+            run_fetch_job(job_id, force)
+        finally:
+            db.session.remove()
+
+def start_fetch_job(trigger='manual', force=False):
+    """
+    Queue a fetch and run it on a background thread
+
+    Args:
+        trigger: What started the fetch ('manual', 'scheduled')
+        force: Skip the freshness probe and always run the full fetch
+
+    Returns:
+        (job, created) as for create_fetch_job
+    """
+    from flask import current_app
+    job, created = create_fetch_job(trigger)
+    if created:
+        app = current_app._get_current_object()
+        threading.Thread(target=_run_in_thread, args=(app, job.id, force),
+                         name=f'fetch-job-{job.id}', daemon=True).start()
+    return job, created
@@ -2,6 +2,8 @@
 Gunicorn configuration for production deployment
 """
 import os
+import shutil
+import tempfile
 
 bind = "127.0.0.1:5000"
 workers = 4
@@ -15,6 +17,26 @@ loglevel = "info"
 accesslog = "-"  # Log to stdout
 errorlog = "-"   # Log to stderr
 
+# Prometheus metrics from all workers are shared through files in this
+# directory, so /metrics reports the whole server rather than one worker.
+# Set here, before any worker imports prometheus_client.
+prometheus_multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "fda_recall_checker_metrics")
+)
+
+def on_starting(server):
+    # Start from empty metric files; leftovers from the last run would be added in
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+    # Cached pages were rendered by the previous deploy's templates and code
+    from response_cache import get_cache_backend
+    get_cache_backend().clear()
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
 # Alternative: Use file logging if logs directory exists and is writable
 # Uncomment below and comment out the above if you prefer file logging
 # log_dir = os.path.join(os.path.dirname(__file__), "logs")
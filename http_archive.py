@@ -0,0 +1,131 @@
+"""
+Record/replay transport for the openFDA and ERPNext HTTP clients
+
+Set HTTP_ARCHIVE_MODE=record to save every request/response pair made
+through the shared sessions to HTTP_ARCHIVE_DIR, and HTTP_ARCHIVE_MODE=replay
+to serve them back from there without touching the network. Each exchange
+is stored as one gzipped JSON file named after a hash of the method, URL
+(with query parameters in sorted order) and request body, so the same
+request always maps to the same file.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+HTTP_ARCHIVE_MODE = os.environ.get('HTTP_ARCHIVE_MODE', '').lower()  # '', 'record' or 'replay'
+HTTP_ARCHIVE_DIR = os.environ.get(
+    'HTTP_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'http_archive')
+)
+
+# Query parameters left out of keys and recordings (credentials)
+IGNORED_PARAMS = ('api_key',)
+
+class ArchiveMissError(requests.ConnectionError):
+    """Raised in replay mode when a request was never recorded"""
+
+def _canonical_url(url):
+    """URL with query parameters sorted and credentials removed, so neither changes the key"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in IGNORED_PARAMS
+    ))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+def archive_key(method, url, body=None):
+    """Stable key for one request"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    digest = hashlib.sha256()
+    digest.update(method.upper().encode())
+    digest.update(b'\n')
+    digest.update(_canonical_url(url).encode())
+    digest.update(b'\n')
+    digest.update(hashlib.sha256(body or b'').digest())
+    return digest.hexdigest()
+
+class ArchiveAdapter(HTTPAdapter):
+    """HTTPAdapter that records responses to, or replays them from, a directory"""
+
+    def __init__(self, mode, directory=None, **kwargs):
+        super().__init__(**kwargs)
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown HTTP archive mode {mode!r}")
+        self.mode = mode
+        self.directory = directory or HTTP_ARCHIVE_DIR
+
+    def _path(self, request):
+        host = urlsplit(request.url).netloc.replace(':', '_') or 'local'
+        return os.path.join(self.directory, host, archive_key(request.method, request.url, request.body) + '.json.gz')
+
+    def send(self, request, **kwargs):
+        path = self._path(request)
+        if self.mode == 'replay':
+            if not os.path.exists(path):
+                raise ArchiveMissError(f"No recorded response for {request.method} {request.url}", request=request)
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return self._build_response(request, json.load(f))
+
+        response = super().send(request, **kwargs)
+        self._save(path, request, response)
+        return response
+
+    def _save(self, path, request, response):
+        record = {
+            'method': request.method,
+            'url': _canonical_url(request.url),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'encoding': response.encoding,
+            'body': base64.b64encode(response.content).decode('ascii'),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so concurrent workers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write(json.dumps(record).encode('utf-8'))
+        os.replace(tmp, path)
+
+    def _build_response(self, request, record):
+        response = requests.Response()
+        response.status_code = record['status']
+        response.reason = record.get('reason')
+        response.headers = CaseInsensitiveDict(record.get('headers', {}))
+        # The stored body is already decoded; don't let requests try to gunzip it again
+        response.headers.pop('Content-Encoding', None)
+        response.encoding = record.get('encoding')
+        response._content = base64.b64decode(record['body'])
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+def mount_archive(session, mode=None, directory=None, **adapter_kwargs):
+    """
+    Mount the archive adapter on a session when an archive mode is configured
+
+    Args:
+        session: requests.Session to wrap
+        mode: 'record' or 'replay' (default HTTP_ARCHIVE_MODE; no-op when empty)
+        directory: Archive location (default HTTP_ARCHIVE_DIR)
+        adapter_kwargs: Passed to HTTPAdapter (e.g. pool_maxsize)
+
+    Returns:
+        The same session
+    """
+    mode = HTTP_ARCHIVE_MODE if mode is None else mode
+    if mode:
+        adapter = ArchiveAdapter(mode, directory, **adapter_kwargs)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    return session
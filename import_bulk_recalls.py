@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Import FDA recalls from an openFDA bulk download file
+
+openFDA publishes the complete device recall dataset as zipped JSON
+(device-recall-0001-of-0001.json.zip, see https://open.fda.gov/data/downloads/).
+This script streams the "results" array out of the archive one record at
+a time, so memory stays flat regardless of file size, and writes the
+records in batches through the same extraction and bulk upsert path as
+the API fetch, queueing new recalls for the ERPNext inventory check the
+same way. No network access is needed.
+
+Run: python3 import_bulk_recalls.py device-recall-0001-of-0001.json.zip [--update]
+"""
+import argparse
+import io
+import json
+import time
+import zipfile
+
+from app import app
+from database import db
+from recall_store import safe_upsert_recalls
+from erpnext_dispatch import enqueue_inserted_recalls
+from fetch_fda_recalls import BATCH_SIZE, build_recall_rows
+
+READ_SIZE = 1 << 16  # characters read from the archive at a time
+
+class _JSONStream:
+    """Minimal pull parser over a text stream, decoding one value at a time"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.stream.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed before growing the buffer
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in bulk file, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+def iter_results(stream):
+    """
+    Yield each record of the top-level "results" array in an openFDA JSON file
+
+    Other top-level keys (such as "meta") are decoded and discarded.
+    """
+    parser = _JSONStream(stream)
+    parser.expect('{')
+    while parser.peek() != '}':
+        key = parser.value()
+        parser.expect(':')
+        if key != 'results':
+            parser.value()
+        else:
+            parser.expect('[')
+            while parser.peek() != ']':
+                yield parser.value()
+                if parser.peek() == ',':
+                    parser.expect(',')
+            parser.expect(']')
+        if parser.peek() == ',':
+            parser.expect(',')
+
+def iter_bulk_records(path):
+    """Yield every recall record in a bulk download (.json.zip or plain .json)"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if not member.endswith('.json'):
+                    continue
+                with archive.open(member) as raw:
+                    yield from iter_results(io.TextIOWrapper(raw, encoding='utf-8'))
+    else:
+        with open(path, encoding='utf-8') as stream:
+            yield from iter_results(stream)
+
+def import_bulk_file(path, update_existing=False, batch_size=BATCH_SIZE):
+    """
+    Stream a bulk download into the database in batches
+
+    Args:
+        path: Path to the downloaded .json.zip (or extracted .json) file
+        update_existing: Refresh recalls that are already stored
+        batch_size: Records per bulk write and commit
+
+    Returns:
+        (records read, records inserted)
+    """
+    with app.app_context():
+        started = time.time()
+        total_read = 0
+        total_inserted = 0
+        batch = []
+
+        def flush():
+            nonlocal total_inserted
+            rows = build_recall_rows(batch)
+            inserted = safe_upsert_recalls(rows, update_existing=update_existing)
+            # Queued for the ERPNext inventory check in the same transaction
+            total_inserted += enqueue_inserted_recalls(batch, rows, inserted)
+            db.session.commit()
+            batch.clear()
+            elapsed = time.time() - started
+            print(f"  {total_read} records read, {total_inserted} new "
+                  f"({total_read / elapsed if elapsed else 0:.0f} rec/s)")
+
+        for item in iter_bulk_records(path):
+            batch.append(item)
+            total_read += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        print("")
+        print("=== Import Complete ===")
+        print(f"Records read: {total_read}")
+        print(f"New records inserted: {total_inserted}")
+        print(f"Elapsed: {time.time() - started:.1f}s")
+        return total_read, total_inserted
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import an openFDA device recall bulk download")
+    parser.add_argument('path', help="Path to device-recall-*.json.zip")
+    parser.add_argument('--update', action='store_true',
+                        help="Also refresh recalls that already exist")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"Records per bulk write (default {BATCH_SIZE})")
+    args = parser.parse_args()
+
+    import_bulk_file(args.path, update_existing=args.update, batch_size=args.batch_size)
@@ -0,0 +1,138 @@
+"""
+Prometheus metrics for the web, ingest and ERPNext paths
+
+/metrics exposes request duration histograms per route, database query
+counts and time per request, ingest counters and last-success
+timestamps, and ERPNext dispatch latency.
+
+Under gunicorn every worker keeps its own counters, so a scrape would
+only see whichever worker answered it. When PROMETHEUS_MULTIPROC_DIR is
+set (gunicorn_config.py does this), prometheus_client writes each
+process's values to files in that directory and /metrics aggregates all
+of them. The variable must be set before this module is first imported.
+"""
+import os
+import time
+
+from flask import Blueprint, Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Web requests
+REQUEST_DURATION = Histogram(
+    'fda_http_request_duration_seconds', 'Time to handle a web request',
+    ['method', 'route', 'status']
+)
+REQUEST_DB_QUERIES = Histogram(
+    'fda_http_request_db_queries', 'Database queries executed per web request', ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+)
+REQUEST_DB_SECONDS = Histogram(
+    'fda_http_request_db_seconds', 'Time spent in database queries per web request', ['route']
+)
+
+# Ingest (openFDA fetch)
+INGEST_RUNS = Counter('fda_ingest_runs_total', 'Fetch runs by result (success, unchanged, error)', ['result'])
+INGEST_PAGES = Counter('fda_ingest_pages_total', 'openFDA result pages written', ['source'])
+INGEST_RECORDS = Counter(
+    'fda_ingest_records_total', 'Recall records processed (seen, inserted, updated)', ['source', 'outcome']
+)
+INGEST_BYTES = Counter('fda_ingest_bytes_total', 'Bytes downloaded from openFDA by fetch runs')
+INGEST_STAGE_SECONDS = Counter(
+    'fda_ingest_stage_seconds_total', 'Time fetch runs spent in each stage', ['stage']
+)
+INGEST_RUN_DURATION = Histogram(
+    'fda_ingest_run_duration_seconds', 'Duration of fetch runs',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+)
+INGEST_LAST_SUCCESS = Gauge(
+    'fda_ingest_last_success_timestamp_seconds', 'Unix time the last fetch run finished without error',
+    multiprocess_mode='max'
+)
+
+# ERPNext dispatch
+ERPNEXT_REQUEST_DURATION = Histogram(
+    'fda_erpnext_request_duration_seconds', 'Latency of ERPNext inventory-check requests', ['result'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+ERPNEXT_RECALLS = Counter('fda_erpnext_recalls_total', 'Recalls sent to ERPNext (sent, failed)', ['result'])
+ERPNEXT_LAST_SUCCESS = Gauge(
+    'fda_erpnext_last_success_timestamp_seconds', 'Unix time of the last successful ERPNext batch',
+    multiprocess_mode='max'
+)
+
+def record_ingest_run(result, timings=None):
+    """
+    Count a finished fetch run
+
+    Args:
+        result: 'success', 'unchanged' (skipped by the freshness probe) or 'error'
+        timings: The run's RunTimings, if any
+    """
+    INGEST_RUNS.labels(result).inc()
+    if timings is not None:
+        INGEST_RUN_DURATION.observe(timings.elapsed)
+        INGEST_BYTES.inc(timings.bytes)
+        for stage, seconds in timings.seconds.items():
+            if seconds:
+                INGEST_STAGE_SECONDS.labels(stage).inc(seconds)
+    if result != 'error':
+        INGEST_LAST_SUCCESS.set(time.time())
+
+def record_erpnext_batch(seconds, count, success):
+    """Count one ERPNext inventory-check request of count recalls"""
+    result = 'sent' if success else 'failed'
+    ERPNEXT_REQUEST_DURATION.labels('success' if success else 'failure').observe(seconds)
+    ERPNEXT_RECALLS.labels(result).inc(count)
+    if success:
+        ERPNEXT_LAST_SUCCESS.set(time.time())
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.get('query_start')
+    # Only queries made while handling a web request are attributed to it;
+    # fetch threads and the scheduler have no request context
+    if start is not None and has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - start
+
+def _route():
+    return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+def _finish_request(response):
+    if 'request_start' in g:
+        route = _route()
+        REQUEST_DURATION.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - g.request_start)
+        REQUEST_DB_QUERIES.labels(route).observe(g.db_queries)
+        REQUEST_DB_SECONDS.labels(route).observe(g.db_seconds)
+    return response
+
+def init_metrics(app):
+    """Time every request on app and serve /metrics"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.register_blueprint(metrics_bp)
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint, aggregated across worker processes when running under gunicorn"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
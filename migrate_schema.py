@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration script to bring an existing database up to the current models
+Creates missing tables, then adds any columns and indexes that were
+added to models.py after the tables were first created. Safe to run
+more than once.
+"""
+import os
+import sys
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from database import db
+import models  # noqa: F401 - registers every model on db.metadata
+
+def migrate():
+    """Create missing tables, columns and indexes"""
+    with app.app_context():
+        print("Creating missing tables...")
+        db.create_all()
+
+        from sqlalchemy import inspect
+        inspector = inspect(db.engine)
+        preparer = db.engine.dialect.identifier_preparer
+        added = 0
+
+        for table in db.metadata.sorted_tables:
+            existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(
+                        f"ALTER TABLE {preparer.format_table(table)} "
+                        f"ADD COLUMN {preparer.format_column(column)} {column_type}"
+                    ))
+                print(f"✓ Added column {table.name}.{column.name} ({column_type})")
+                added += 1
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(db.engine)
+                print(f"✓ Created index {index.name}")
+                added += 1
+
+        # Full-text search index and its sync triggers (SQLite only)
+        from recall_search import ensure_search_index
+        ensure_search_index()
+        # Materialized recall counts, built once from the existing recalls
+        from recall_stats import ensure_stats
+        ensure_stats()
+
+        if added:
+            print(f"✓ Migration complete! {added} change(s) applied")
+        else:
+            print("✓ Schema already up to date")
+
+if __name__ == '__main__':
+    migrate()
@@ -19,8 +19,12 @@ class FDADeviceRecall(db.Model):
     status = db.Column(db.String(100), index=True)
     recall_firm = db.Column(db.String(200))
     code_info = db.Column(db.String(140))
+    content_hash = db.Column(db.String(64))  # sha256 of the source columns, see recall_store.content_hash
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Keyset pagination order, see recall_pages
+    __table_args__ = (db.Index('ix_fda_device_recall_recall_date_id', 'recall_date', 'id'),)
     
     def __repr__(self):
         return f'<FDADeviceRecall {self.name}>'
@@ -53,7 +57,194 @@ class RecallCheckHistory(db.Model):
     inventory_checked = db.Column(db.Boolean, default=False)
     matches_found = db.Column(db.Integer, default=0)
     notes = db.Column(db.String(500))
+    # Run timing, see run_timings.RunTimings (empty for runs before it was recorded)
+    duration_seconds = db.Column(db.Float)
+    http_seconds = db.Column(db.Float)
+    decode_seconds = db.Column(db.Float)
+    extract_seconds = db.Column(db.Float)
+    dedup_seconds = db.Column(db.Float)
+    write_seconds = db.Column(db.Float)
+    dispatch_seconds = db.Column(db.Float)
+    pages_fetched = db.Column(db.Integer)
+    bytes_fetched = db.Column(db.BigInteger)
+    records_processed = db.Column(db.Integer)
+    records_per_second = db.Column(db.Float)
     
     def __repr__(self):
         return f'<RecallCheckHistory {self.check_date} - {self.matches_found} matches>'
+    
+    def timing_dict(self):
+        """Timing and throughput of the run, for the /stats trend"""
+        return {
+            'check_date': self.check_date.isoformat() if self.check_date else None,
+            'duration_seconds': self.duration_seconds,
+            'stages': {
+                'http': self.http_seconds,
+                'decode': self.decode_seconds,
+                'extract': self.extract_seconds,
+                'dedup': self.dedup_seconds,
+                'write': self.write_seconds,
+                'dispatch': self.dispatch_seconds
+            },
+            'pages_fetched': self.pages_fetched,
+            'bytes_fetched': self.bytes_fetched,
+            'records_processed': self.records_processed,
+            'records_per_second': self.records_per_second
+        }
+
+
+class IngestCheckpoint(db.Model):
+    """Progress of an ingest run, saved after every page so an interrupted run can resume"""
+    __tablename__ = 'ingest_checkpoint'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(100), nullable=False, index=True)
+    search = db.Column(db.String(500))
+    last_skip = db.Column(db.Integer)  # last page offset written (last row id for keyset runs)
+    last_event_date_posted = db.Column(db.Date)
+    records_written = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    started_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f'<IngestCheckpoint {self.source} {self.search} skip={self.last_skip}>'
+
+class IngestState(db.Model):
+    """Last successfully ingested watermark for each source and date field"""
+    __tablename__ = 'ingest_state'
+    __table_args__ = (db.UniqueConstraint('source', 'field', name='uq_ingest_state_source_field'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(100), nullable=False)
+    field = db.Column(db.String(100), nullable=False)  # openFDA date field the watermark applies to
+    watermark = db.Column(db.Date)  # latest date fully ingested
+    last_success_at = db.Column(db.DateTime)
+    # What the limit=1 freshness probe reported for the last fully ingested search
+    last_search = db.Column(db.String(500))
+    last_total = db.Column(db.Integer)
+    last_updated = db.Column(db.String(20))  # openFDA meta.last_updated
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f'<IngestState {self.source} {self.field}={self.watermark}>'
+
+class ERPNextOutbox(db.Model):
+    """New recalls waiting to be cross-referenced against ERPNext inventory"""
+    __tablename__ = 'erpnext_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recall_id = db.Column(db.Integer, index=True)
+    recall_number = db.Column(db.String(200), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON sent to ERPNext for this recall
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending/sending/sent/failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    claim_token = db.Column(db.String(36), index=True)
+    claimed_at = db.Column(db.DateTime)
+    idempotency_key = db.Column(db.String(64))
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    sent_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ERPNextOutbox {self.recall_number} {self.status}>'
+
+class SchedulerLease(db.Model):
+    """Leadership lease; only the process holding an unexpired lease runs scheduled jobs"""
+    __tablename__ = 'scheduler_lease'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    holder = db.Column(db.String(200))
+    expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<SchedulerLease {self.name} held by {self.holder} until {self.expires_at}>'
+
+class JobRun(db.Model):
+    """One run of a scheduled job; the unique (job, slot) pair makes each slot run once"""
+    __tablename__ = 'job_run'
+    __table_args__ = (db.UniqueConstraint('job', 'slot', name='uq_job_run_job_slot'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(100), nullable=False, index=True)
+    slot = db.Column(db.DateTime, nullable=False)  # scheduled time this run belongs to
+    status = db.Column(db.String(20), default='running', nullable=False, index=True)  # running/succeeded/failed
+    holder = db.Column(db.String(200))
+    started_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.String(500))
+    
+    def __repr__(self):
+        return f'<JobRun {self.job} {self.slot} {self.status}>'
+
+class FetchJob(db.Model):
+    """A fetch started from the web UI or scheduler, with progress for polling"""
+    __tablename__ = 'fetch_job'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    trigger = db.Column(db.String(50), default='manual')  # manual/scheduled/refetch
+    # Set while the job is queued or running; the unique index merges concurrent triggers
+    active_key = db.Column(db.String(50), unique=True)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued/running/succeeded/failed
+    stage = db.Column(db.String(100))
+    pages_done = db.Column(db.Integer, default=0)
+    records_seen = db.Column(db.Integer, default=0)
+    records_inserted = db.Column(db.Integer, default=0)
+    records_updated = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<FetchJob {self.id} {self.status}>'
+    
+    def to_dict(self):
+        """Convert to dictionary for JSON serialization"""
+        end = self.finished_at or datetime.now()
+        elapsed = (end - self.started_at).total_seconds() if self.started_at else 0
+        return {
+            'id': self.id,
+            'trigger': self.trigger,
+            'status': self.status,
+            'stage': self.stage,
+            'pages_done': self.pages_done,
+            'records_seen': self.records_seen,
+            'records_inserted': self.records_inserted,
+            'records_updated': self.records_updated,
+            'elapsed_seconds': round(elapsed, 1),
+            'records_per_second': round(self.records_seen / elapsed, 1) if elapsed and self.records_seen else 0,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
 
+class RecallStat(db.Model):
+    """Recall counts per dimension, kept up to date as recalls are written (see recall_stats)"""
+    __tablename__ = 'recall_stat'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dimension = db.Column(db.String(20), nullable=False)  # total/status/month/firm
+    value = db.Column(db.String(200), nullable=False, default='')  # '' for the total and for missing values
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('dimension', 'value', name='uq_recall_stat_dimension_value'),)
+    
+    def __repr__(self):
+        return f'<RecallStat {self.dimension}={self.value!r}: {self.count}>'
+
+class DataVersion(db.Model):
+    """Counter bumped whenever stored recall data changes; keys the response cache (see response_cache)"""
+    __tablename__ = 'data_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.name} v{self.version}>'
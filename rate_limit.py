@@ -0,0 +1,120 @@
+"""
+Client-side rate limiting for openFDA requests
+
+openFDA allows 240 requests per minute and 1,000 requests per day per IP
+address without an API key, or 120,000 per day with one
+(https://open.fda.gov/apis/authentication/). A token bucket refilled at
+the per-minute rate, plus a daily counter, keeps us under both.
+
+The bucket state lives in a small JSON file guarded by an exclusive
+fcntl lock, so every thread, gunicorn worker and backfill process on the
+host draws from the same budget. A Retry-After from the server pauses all
+of them. On platforms without fcntl the limiter is per process only.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+FDA_API_KEY = os.environ.get('FDA_API_KEY') or None
+FDA_REQUESTS_PER_MINUTE = int(os.environ.get('FDA_REQUESTS_PER_MINUTE', 240))
+FDA_REQUESTS_PER_DAY = int(os.environ.get('FDA_REQUESTS_PER_DAY', 120000 if FDA_API_KEY else 1000))
+FDA_RATE_LIMIT_FILE = os.environ.get(
+    'FDA_RATE_LIMIT_FILE',
+    os.path.join(tempfile.gettempdir(), 'fda_recall_checker_ratelimit.json')
+)
+
+class DailyQuotaExceeded(Exception):
+    """Raised when the per-day request quota has been used up"""
+
+class RateLimiter:
+    """Token bucket with a daily cap, shared through a locked state file"""
+
+    def __init__(self, per_minute=FDA_REQUESTS_PER_MINUTE, per_day=FDA_REQUESTS_PER_DAY,
+                 path=FDA_RATE_LIMIT_FILE):
+        self.capacity = max(per_minute, 1)
+        self.rate = self.capacity / 60.0  # tokens per second
+        self.per_day = per_day
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """Yield the shared state dict under an exclusive lock and write it back"""
+        with self._thread_lock:
+            with open(self.path, 'a+') as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or '{}')
+                    except ValueError:
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self):
+        """
+        Block until a request may be sent, then consume one token
+
+        Raises:
+            DailyQuotaExceeded: if today's quota is already spent
+        """
+        while True:
+            with self._state() as state:
+                now = time.time()
+                today = date.today().isoformat()
+                if state.get('day') != today:
+                    state['day'] = today
+                    state['day_count'] = 0
+                if state['day_count'] >= self.per_day:
+                    raise DailyQuotaExceeded(
+                        f"openFDA daily quota of {self.per_day} requests used up"
+                        + ("" if FDA_API_KEY else "; set FDA_API_KEY for a higher limit")
+                    )
+
+                tokens = state.get('tokens', self.capacity)
+                updated = state.get('updated', now)
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+                blocked_until = state.get('blocked_until', 0)
+
+                if now >= blocked_until and tokens >= 1:
+                    state['tokens'] = tokens - 1
+                    state['updated'] = now
+                    state['day_count'] += 1
+                    return
+                state['tokens'] = tokens
+                state['updated'] = now
+                wait = max(blocked_until - now, (1 - tokens) / self.rate)
+            time.sleep(min(wait, 5))
+
+    def pause(self, seconds):
+        """Hold back every client sharing this limiter for the given time"""
+        with self._state() as state:
+            state['blocked_until'] = max(state.get('blocked_until', 0), time.time() + seconds)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_fda_rate_limiter():
+    """Return the process-wide limiter for openFDA requests"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
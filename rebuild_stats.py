@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Check or rebuild the materialized recall statistics (recall_stat table)
+
+The counts are normally kept up to date as recalls are written. This
+recomputes them from fda_device_recall, reports any that had drifted,
+and replaces the stored counts. With --check nothing is written.
+
+Run: python3 rebuild_stats.py [--check]
+"""
+import argparse
+import os
+import sys
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from database import db
+from recall_stats import check_stats, rebuild_stats
+
+def main(check_only=False):
+    """Report stats that differ from the recalls, then rebuild unless check_only"""
+    with app.app_context():
+        db.create_all()
+        mismatches = check_stats()
+        if mismatches:
+            print(f"✗ {len(mismatches)} stat(s) differ from the recalls:")
+            for dimension, value, stored, actual in mismatches[:50]:
+                print(f"  {dimension} {value or '(none)'!r}: stored {stored}, actual {actual}")
+            if len(mismatches) > 50:
+                print(f"  ... and {len(mismatches) - 50} more")
+        else:
+            print("✓ Stored statistics match the recalls")
+
+        if check_only:
+            return not mismatches
+
+        written = rebuild_stats()
+        db.session.commit()
+        print(f"✓ Rebuilt {written} stats")
+        return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check or rebuild the materialized recall statistics")
+    parser.add_argument('--check', action='store_true', help="Only compare the stored stats with the recalls")
+    args = parser.parse_args()
+    sys.exit(0 if main(check_only=args.check) else 1)
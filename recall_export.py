@@ -0,0 +1,138 @@
+"""
+Streaming bulk export of recalls as NDJSON or CSV
+
+Rows are read in id order in chunks of EXPORT_CHUNK_SIZE, each chunk
+starting after the last id of the previous one (keyset on the primary
+key), as plain column tuples rather than ORM objects. Every chunk is
+serialized and handed to the client before the next one is read, so
+memory stays flat however many recalls are exported. The read
+transaction is ended after each chunk, so a long export doesn't hold
+SQLite's read lock against a fetch that is trying to commit.
+
+Incremental pulls overlap: a writer stamps updated_at when it writes a
+row, not when it commits, so a row can become visible after an export
+that started later than its updated_at. The since= suggested for the
+next pull is therefore the export's start minus EXPORT_SINCE_MARGIN,
+and consumers must expect to receive some recalls again.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from database import db
+from models import FDADeviceRecall
+from recall_search import search_recalls
+
+EXPORT_CHUNK_SIZE = 1000
+# Longer than any write transaction stays open (a fetch commits every
+# INGEST_COMMIT_EVERY records, including openFDA retries in between)
+EXPORT_SINCE_MARGIN = timedelta(seconds=int(os.environ.get('EXPORT_SINCE_MARGIN_SECONDS', 15 * 60)))
+
+# Same fields, in the same order, as FDADeviceRecall.to_dict
+EXPORT_COLUMNS = (
+    'id', 'name', 'recall_number', 'device_name', 'manufacturer', 'product_code',
+    'recall_date', 'reason', 'status', 'recall_firm', 'code_info', 'created_at', 'updated_at'
+)
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+def parse_since(value):
+    """
+    Parse a since= value (an ISO date or date-time, in UTC like updated_at)
+
+    Raises:
+        ValueError: if the value is not an ISO date or date-time
+    """
+    since = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+def next_since(started):
+    """The since= for the next incremental pull after an export that started at started (UTC)"""
+    return started - EXPORT_SINCE_MARGIN
+
+def export_query(search=None, since=None):
+    """Columns of the recalls to export, matching search and changed at or after since"""
+    query = FDADeviceRecall.query.with_entities(*(getattr(FDADeviceRecall, name) for name in EXPORT_COLUMNS))
+    if search:
+        query = search_recalls(query, search, ranked=False)
+    if since is not None:
+        query = query.filter(FDADeviceRecall.updated_at >= since)
+    return query
+
+def iter_export_rows(query, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield lists of up to chunk_size export rows (dicts of EXPORT_COLUMNS) in id order
+
+    Args:
+        query: Query from export_query
+        chunk_size: Rows read per round trip
+    """
+    last_id = 0
+    while True:
+        rows = query.filter(FDADeviceRecall.id > last_id).order_by(FDADeviceRecall.id).limit(chunk_size).all()
+        # Release the read transaction between chunks
+        db.session.rollback()
+        if not rows:
+            return
+        yield [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].id
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def iter_ndjson(chunks):
+    """One JSON object per line"""
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps({key: _value(value) for key, value in row.items()}, separators=(',', ':')) + '\n'
+            for row in chunk
+        ).encode('utf-8')
+
+def iter_csv(chunks):
+    """A header line, then one line per recall"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in chunks:
+        writer.writerows([_value(row[key]) for key in EXPORT_COLUMNS] for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def iter_gzip(pieces):
+    """Compress a stream of byte strings into one gzip file, as it is produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_stream(fmt, search=None, since=None, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Byte chunks of an export of the matching recalls
+
+    Args:
+        fmt: 'ndjson' or 'csv'
+        search: Only recalls matching this search text
+        since: Only recalls created or updated at or after this UTC datetime
+        compress: gzip the output
+        chunk_size: Rows read per round trip
+    """
+    chunks = iter_export_rows(export_query(search, since), chunk_size)
+    pieces = iter_csv(chunks) if fmt == 'csv' else iter_ndjson(chunks)
+    return iter_gzip(pieces) if compress else pieces
@@ -0,0 +1,110 @@
+"""
+Keyset (cursor) pagination over recalls
+
+Recalls are walked newest first in (recall_date, id) order, with undated
+recalls last. Instead of OFFSET, each page starts after an opaque cursor
+naming the last row of the previous page, so the database seeks straight
+to it through the (recall_date, id) index and every page costs the same
+no matter how deep into the table it is.
+"""
+import base64
+import json
+from datetime import date
+
+from database import db
+from models import FDADeviceRecall
+from response_cache import cached_value
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+class InvalidCursor(ValueError):
+    """Raised when an after= token can't be decoded"""
+
+def clamp_per_page(per_page):
+    """Keep a requested page size between 1 and MAX_PER_PAGE"""
+    return min(max(per_page or DEFAULT_PER_PAGE, 1), MAX_PER_PAGE)
+
+def encode_cursor(recall):
+    """Opaque token for the position just after recall"""
+    key = [recall.recall_date.isoformat() if recall.recall_date else None, recall.id]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """
+    Decode an after= token
+
+    Returns:
+        (recall_date or None, id)
+
+    Raises:
+        InvalidCursor: if the token was not produced by encode_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        recall_date, recall_id = json.loads(raw)
+        return (date.fromisoformat(recall_date) if recall_date else None), int(recall_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {token!r}") from e
+
+def _order(query):
+    recall_date = FDADeviceRecall.recall_date.desc()
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # PostgreSQL sorts NULLs first in descending order; SQLite and MySQL already put them last
+        recall_date = recall_date.nulls_last()
+    return query.order_by(recall_date, FDADeviceRecall.id.desc())
+
+def keyset_page(query, after=None, per_page=DEFAULT_PER_PAGE):
+    """
+    Fetch one page of a FDADeviceRecall query in (recall_date, id) order
+
+    Dated and undated recalls are read separately, so each part is a
+    plain range on the index that the database can seek into.
+
+    Args:
+        query: FDADeviceRecall query, filtered but not ordered
+        after: Cursor from the previous page, or None for the first page
+        per_page: Page size (capped at MAX_PER_PAGE)
+
+    Returns:
+        (recalls, cursor for the next page or None at the end)
+
+    Raises:
+        InvalidCursor: if after can't be decoded
+    """
+    per_page = clamp_per_page(per_page)
+    after_date, after_id = decode_cursor(after) if after else (None, None)
+    recall_date = FDADeviceRecall.recall_date
+    items = []
+
+    if after is None or after_date is not None:
+        dated = query.filter(recall_date.isnot(None))
+        if after_date is not None:
+            dated = dated.filter(
+                recall_date <= after_date,
+                db.or_(recall_date < after_date, FDADeviceRecall.id < after_id)
+            )
+        # One extra row tells us whether there is another page
+        items = _order(dated).limit(per_page + 1).all()
+
+    if len(items) <= per_page:
+        undated = query.filter(recall_date.is_(None))
+        if after is not None and after_date is None:
+            undated = undated.filter(FDADeviceRecall.id < after_id)
+        items += undated.order_by(FDADeviceRecall.id.desc()).limit(per_page + 1 - len(items)).all()
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    return items, (encode_cursor(items[-1]) if has_more else None)
+
+def cached_total(query, key):
+    """
+    Count a query, reusing the count for the same key until the data changes
+
+    Counting a large table is the slowest part of a page request, so
+    clients walking the dataset page by page don't pay for it every time.
+    The count is kept in the shared response cache under the current data
+    version, so every worker reuses it and none serves it once a write
+    has changed the recalls.
+    """
+    return cached_value(f"total:{key or ''}", lambda: query.order_by(None).count())
@@ -0,0 +1,158 @@
+"""
+Full-text search over recalls
+
+On SQLite the searchable columns are indexed in an FTS5 table that uses
+fda_device_recall as its external content, so the text is not stored
+twice. Triggers on fda_device_recall keep the index in step with every
+insert, update and delete, whichever code path writes the row. Searches
+match each word of the query as a prefix and are ranked with bm25, so
+their cost depends on the number of matches rather than the size of the
+table.
+
+Other databases, or SQLite builds without FTS5, fall back to the
+substring (LIKE '%term%') filter the app used before.
+"""
+import re
+
+from sqlalchemy.exc import OperationalError
+
+from database import db
+from models import FDADeviceRecall
+
+LIVE_TABLE = FDADeviceRecall.__tablename__
+FTS_TABLE = f'{LIVE_TABLE}_fts'
+
+# Indexed columns and their bm25 weights (a hit in the device name counts most)
+SEARCH_COLUMNS = (
+    ('device_name', 10.0),
+    ('recall_number', 5.0),
+    ('recall_firm', 3.0),
+    ('product_code', 5.0),
+)
+
+# Words of a search query; FTS5's unicode61 tokenizer splits text the same way
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+_available = {}
+
+def _columns(prefix=''):
+    return ', '.join(f'{prefix}{name}' for name, _ in SEARCH_COLUMNS)
+
+def _trigger_sql():
+    """Triggers that mirror every change to the recall table into the FTS index"""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {LIVE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns('new.')});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {LIVE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) VALUES ('delete', old.id, {_columns('old.')});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns()} ON {LIVE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) VALUES ('delete', old.id, {_columns('old.')});
+            INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns('new.')});
+        END""",
+    ]
+
+def ensure_search_index(conn=None):
+    """
+    Create the FTS5 index and its triggers if they don't exist yet
+
+    A newly created index is filled from the existing rows. Safe to run
+    on every start-up.
+
+    Args:
+        conn: Connection to run in (default: a new transaction on db.engine)
+
+    Returns:
+        True if the FTS index is in place, False if the database can't have one
+    """
+    if conn is None:
+        with db.engine.begin() as conn:
+            return ensure_search_index(conn)
+    if conn.dialect.name != 'sqlite':
+        return False
+
+    exists = conn.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first()
+    if not exists:
+        try:
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({_columns()}, "
+                f"content='{LIVE_TABLE}', content_rowid='id', prefix='2 3')"
+            )
+        except OperationalError as e:
+            print(f"⚠ Full-text search unavailable, using substring search: {e}")
+            _available[str(conn.engine.url)] = False
+            return False
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        print(f"✓ Created full-text search index {FTS_TABLE}")
+    for sql in _trigger_sql():
+        conn.exec_driver_sql(sql)
+    _available[str(conn.engine.url)] = True
+    return True
+
+def rebuild_search_index(conn):
+    """
+    Re-attach the index to a recall table that was swapped in, and refill it
+
+    The triggers are dropped along with the table they were defined on,
+    so they are recreated before the index is rebuilt from the new rows.
+    """
+    if not ensure_search_index(conn):
+        return False
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+def search_available():
+    """True if searches can use the FTS index on the current database"""
+    key = str(db.engine.url)
+    if key not in _available:
+        if db.engine.dialect.name != 'sqlite':
+            _available[key] = False
+        else:
+            _available[key] = db.session.execute(
+                db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+            ).first() is not None
+    return _available[key]
+
+def match_expression(search):
+    """FTS5 query matching every word of search as a prefix, or None if it has no words"""
+    words = _WORD.findall(search.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search_recalls(query, search, ranked=True):
+    """
+    Restrict a FDADeviceRecall query to recalls matching search
+
+    Args:
+        query: FDADeviceRecall query to filter
+        search: Text typed by the user
+        ranked: Order the results; pass False to order them yourself
+
+    Returns:
+        The filtered query, ordered best match first when ranked (by bm25
+        on SQLite, newest first on the substring fallback)
+    """
+    expression = match_expression(search)
+    if expression is None or not search_available():
+        query = query.filter(
+            db.or_(*(getattr(FDADeviceRecall, name).contains(search) for name, _ in SEARCH_COLUMNS))
+        )
+        return query.order_by(FDADeviceRecall.recall_date.desc()) if ranked else query
+
+    fts = db.table(FTS_TABLE, db.column('rowid'))
+    hits = (
+        db.select(
+            fts.c.rowid.label('recall_id'),
+            db.func.bm25(db.literal_column(FTS_TABLE), *(weight for _, weight in SEARCH_COLUMNS)).label('score')
+        )
+        .select_from(fts)
+        .where(db.literal_column(FTS_TABLE).op('MATCH')(expression))
+        .subquery()
+    )
+    query = query.join(hits, FDADeviceRecall.id == hits.c.recall_id)
+    # bm25 scores are negative; lower is a better match
+    return query.order_by(hits.c.score, FDADeviceRecall.recall_date.desc()) if ranked else query
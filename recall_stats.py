@@ -0,0 +1,192 @@
+"""
+Materialized recall statistics
+
+The recall_stat table holds one count per (dimension, value): the total,
+recalls per status, per month of recall_date and per recalling firm.
+recall_store applies +1/-1 deltas in the same transaction as every
+insert and changed-row update, so the dashboard, /stats and /api/stats
+read a handful of small rows instead of counting and grouping the whole
+recall table. rebuild_stats() recomputes everything from the recalls,
+and check_stats() compares the two (see rebuild_stats.py).
+"""
+from collections import Counter
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import FDADeviceRecall, RecallStat
+from response_cache import bump_data_version
+
+DIMENSIONS = ('total', 'status', 'month', 'firm')
+VALUE_LENGTH = 200
+
+def stat_keys(row):
+    """(dimension, value) pairs a recall row is counted under"""
+    recall_date = row.get('recall_date')
+    return (
+        ('total', ''),
+        ('status', (row.get('status') or '')[:VALUE_LENGTH]),
+        ('month', recall_date.strftime('%Y-%m') if recall_date else ''),
+        ('firm', (row.get('recall_firm') or '')[:VALUE_LENGTH]),
+    )
+
+def count_rows(rows):
+    """Counter of (dimension, value) over recall rows"""
+    counts = Counter()
+    for row in rows:
+        counts.update(stat_keys(row))
+    return counts
+
+def record_stat_changes(added=(), removed=()):
+    """
+    Apply the stat deltas for recall rows added to and removed from the table
+
+    An updated recall is passed in both: its old values as removed and its
+    new values as added. Runs in the caller's transaction.
+    """
+    deltas = count_rows(added)
+    deltas.subtract(count_rows(removed))
+    rows = [{'dimension': dimension, 'value': value, 'count': delta}
+            for (dimension, value), delta in deltas.items() if delta]
+    if rows:
+        _increment(rows)
+
+def _increment(rows):
+    """Add each row's count to its stat, creating missing stats"""
+    table = RecallStat.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['dimension', 'value'], set_={'count': table.c['count'] + stmt.excluded['count']}
+        )
+        db.session.execute(stmt, rows)
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        db.session.execute(stmt.on_duplicate_key_update(count=table.c['count'] + stmt.inserted['count']), rows)
+    else:
+        for row in rows:
+            result = db.session.execute(
+                db.update(table)
+                .where(table.c.dimension == row['dimension'], table.c.value == row['value'])
+                .values(count=table.c['count'] + row['count'])
+            )
+            if not result.rowcount:
+                db.session.execute(db.insert(table), [row])
+
+def compute_stats(conn=None):
+    """
+    Count every stat from scratch with GROUP BY queries on fda_device_recall
+
+    Returns:
+        Counter of (dimension, value) -> count
+    """
+    conn = conn or db.session.connection()
+    table = FDADeviceRecall.__table__
+    counts = Counter({('total', ''): conn.execute(db.select(db.func.count()).select_from(table)).scalar()})
+    # Months and long names are folded in Python, so the queries stay portable
+    for column, dimension in ((table.c.status, 'status'), (table.c.recall_firm, 'firm'),
+                              (table.c.recall_date, 'month')):
+        for value, count in conn.execute(db.select(column, db.func.count()).group_by(column)):
+            if dimension == 'month':
+                if isinstance(value, str):
+                    value = date.fromisoformat(value)
+                value = value.strftime('%Y-%m') if value else ''
+            else:
+                value = (value or '')[:VALUE_LENGTH]
+            counts[(dimension, value)] += count
+    return counts
+
+def rebuild_stats(conn=None):
+    """
+    Replace the stored stats with freshly computed ones
+
+    Also bumps the data version, so cached responses showing the old
+    counts are dropped. Runs in the caller's transaction (conn, or the
+    session's); the caller commits.
+
+    Returns:
+        Number of stat rows written
+    """
+    conn = conn or db.session.connection()
+    counts = compute_stats(conn)
+    table = RecallStat.__table__
+    conn.execute(db.delete(table))
+    conn.execute(db.insert(table), [
+        {'dimension': dimension, 'value': value, 'count': count}
+        for (dimension, value), count in counts.items()
+    ])
+    bump_data_version(conn)
+    return len(counts)
+
+def check_stats():
+    """
+    Compare the stored stats with freshly computed ones
+
+    Returns:
+        List of (dimension, value, stored, actual) for every stat that differs
+    """
+    stored = Counter({
+        (dimension, value): count
+        for dimension, value, count in db.session.execute(
+            db.select(RecallStat.dimension, RecallStat.value, RecallStat.count)
+        )
+        if count
+    })
+    actual = compute_stats()
+    return sorted(
+        (dimension, value, stored.get((dimension, value), 0), actual.get((dimension, value), 0))
+        for dimension, value in set(stored) | set(actual)
+        if stored.get((dimension, value), 0) != actual.get((dimension, value), 0)
+    )
+
+def ensure_stats():
+    """Build the stats once for a database that predates them"""
+    if db.session.execute(
+        db.select(RecallStat.id).where(RecallStat.dimension == 'total')
+    ).first() is not None:
+        return False
+    try:
+        written = rebuild_stats()
+        db.session.commit()
+    except IntegrityError:
+        # Another worker built them at the same time
+        db.session.rollback()
+        return False
+    print(f"✓ Built recall statistics ({written} stats)")
+    return True
+
+def get_stats(dimension):
+    """
+    Stored counts for one dimension
+
+    Returns:
+        dict of value -> count ('' for recalls without a value), largest first
+    """
+    rows = db.session.execute(
+        db.select(RecallStat.value, RecallStat.count)
+        .where(RecallStat.dimension == dimension, RecallStat.count > 0)
+        .order_by(RecallStat.count.desc())
+    )
+    return {value: count for value, count in rows}
+
+def get_total():
+    """Number of recalls stored"""
+    return db.session.execute(
+        db.select(RecallStat.count).where(RecallStat.dimension == 'total')
+    ).scalar() or 0
+
+def get_top(dimension, limit=10):
+    """The limit largest (value, count) pairs of a dimension ('' for no value)"""
+    return [(value, count) for value, count in db.session.execute(
+        db.select(RecallStat.value, RecallStat.count)
+        .where(RecallStat.dimension == dimension, RecallStat.count > 0)
+        .order_by(RecallStat.count.desc())
+        .limit(limit)
+    )]
@@ -0,0 +1,236 @@
+"""
+Bulk write path for FDA recall records
+Inserts whole pages with one executemany statement and lets the database
+resolve recall_number conflicts instead of checking each record in Python.
+Writes to the live table also keep the recall_stat counts up to date and
+bump the data version that invalidates cached responses.
+"""
+import hashlib
+import json
+from datetime import datetime
+from sqlalchemy.exc import DataError, IntegrityError
+from database import db
+from models import FDADeviceRecall
+from recall_stats import record_stat_changes
+from response_cache import bump_data_version
+
+# Columns refreshed from the FDA source when an existing recall is upserted
+UPDATE_COLUMNS = (
+    'name', 'device_name', 'product_code', 'recall_date', 'reason',
+    'status', 'recall_firm', 'code_info'
+)
+
+# Stay well under SQLite's bound-parameter limit for IN (...) probes
+PROBE_CHUNK_SIZE = 500
+
+def content_hash(row):
+    """
+    Fingerprint the source columns of a recall row
+
+    Two rows with the same hash would store identical values, so an
+    existing recall only needs rewriting when its hash changes.
+    """
+    values = [row.get(column) for column in UPDATE_COLUMNS]
+    payload = json.dumps(values, default=lambda value: value.isoformat(), separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _dialect_insert(table):
+    """
+    Build an INSERT for the current dialect that supports conflict handling
+
+    Returns:
+        (insert statement, dialect family) - family is None when the
+        dialect has no native upsert and conflicts must be resolved in Python
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table), 'on_conflict'
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table), 'on_conflict'
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        return insert(table), 'mysql'
+    return db.insert(table), None
+
+def existing_recall_ids(recall_numbers, table=None):
+    """
+    Look up which recall numbers are already stored
+
+    Args:
+        recall_numbers: Iterable of recall numbers to check
+        table: Table to look in (default fda_device_recall)
+
+    Returns:
+        dict mapping each stored recall_number to its row id
+    """
+    table = FDADeviceRecall.__table__ if table is None else table
+    recall_numbers = list(set(recall_numbers))
+    existing = {}
+    for start in range(0, len(recall_numbers), PROBE_CHUNK_SIZE):
+        chunk = recall_numbers[start:start + PROBE_CHUNK_SIZE]
+        matches = db.session.execute(
+            db.select(table.c.recall_number, table.c.id)
+            .where(table.c.recall_number.in_(chunk))
+        )
+        existing.update(matches.all())
+    return existing
+
+def upsert_recalls(rows, update_existing=False, table=None):
+    """
+    Write a page of recall rows with a single bulk statement
+
+    Conflicts on recall_number are resolved by the database with
+    ON CONFLICT DO NOTHING (INSERT IGNORE on MySQL); with update_existing,
+    changed existing recalls are then rewritten by update_changed_recalls.
+    Dialects without a native upsert fall back to a single IN (...) probe
+    followed by plain bulk INSERT. New recalls written to the live table
+    are added to the recall_stat counts and bump the data version.
+    The caller is responsible for committing.
+
+    Args:
+        rows: List of column dicts as built by build_recall_rows
+        update_existing: Refresh source columns of existing recalls whose content hash changed
+        table: Table to write to (default fda_device_recall)
+
+    Returns:
+        dict mapping each newly inserted recall_number to its row id
+        (None when the dialect cannot return generated ids)
+    """
+    # Collapse repeats within the page; the last copy of a record wins
+    rows = list({row['recall_number']: row for row in rows if row.get('recall_number')}.values())
+    if not rows:
+        return {}
+
+    live = table is None or table is FDADeviceRecall.__table__
+    table = FDADeviceRecall.__table__ if table is None else table
+    inserted = _insert_rows(rows, update_existing, table)
+    if live and inserted:
+        record_stat_changes(added=[row for row in rows if row['recall_number'] in inserted])
+        bump_data_version()
+    return inserted
+
+def _insert_rows(rows, update_existing, table):
+    """upsert_recalls without the stats bookkeeping"""
+    stmt, family = _dialect_insert(table)
+    dialect = db.session.get_bind().dialect
+    can_return = dialect.insert_executemany_returning
+
+    if family == 'on_conflict' and not update_existing and can_return:
+        # RETURNING only reports rows that were actually inserted
+        stmt = stmt.on_conflict_do_nothing(index_elements=['recall_number'])
+        result = db.session.execute(
+            stmt.returning(table.c.recall_number, table.c.id), rows
+        )
+        return dict(result.all())
+
+    existing = existing_recall_ids((row['recall_number'] for row in rows), table)
+    new_rows = [row for row in rows if row['recall_number'] not in existing]
+
+    if family is None:
+        if new_rows:
+            db.session.execute(db.insert(table), new_rows)
+        if update_existing:
+            update_changed_recalls([row for row in rows if row['recall_number'] in existing], table)
+        inserted_ids = existing_recall_ids((row['recall_number'] for row in new_rows), table)
+        return {row['recall_number']: inserted_ids.get(row['recall_number']) for row in new_rows}
+
+    if family == 'on_conflict':
+        stmt = stmt.on_conflict_do_nothing(index_elements=['recall_number'])
+    else:
+        stmt = stmt.prefix_with('IGNORE')
+
+    if can_return:
+        result = db.session.execute(stmt.returning(table.c.recall_number, table.c.id), rows)
+        ids = dict(result.all())
+    else:
+        db.session.execute(stmt, rows)
+        ids = existing_recall_ids((row['recall_number'] for row in new_rows), table)
+    if update_existing:
+        # Rewritten separately rather than with DO UPDATE / ON DUPLICATE KEY UPDATE:
+        # unchanged rows are skipped and the old values are seen for the stats
+        update_changed_recalls([row for row in rows if row['recall_number'] in existing], table)
+    return {row['recall_number']: ids.get(row['recall_number']) for row in new_rows}
+
+def update_changed_recalls(rows, table=None):
+    """
+    Rewrite stored recalls whose content hash differs from the fetched row
+
+    Stored hashes are read with chunked IN (...) probes and the changed
+    rows are written with one bulk UPDATE; unchanged rows are not touched,
+    so updated_at only moves when FDA actually changed something. On the
+    live table the recall_stat counts move from the old values to the new.
+    The caller is responsible for committing.
+
+    Args:
+        rows: List of column dicts as built by build_recall_rows
+        table: Table to write to (default fda_device_recall)
+
+    Returns:
+        list of recall numbers that were updated
+    """
+    live = table is None or table is FDADeviceRecall.__table__
+    table = FDADeviceRecall.__table__ if table is None else table
+    rows = list({row['recall_number']: row for row in rows if row.get('recall_number')}.values())
+    stored = {}
+    for start in range(0, len(rows), PROBE_CHUNK_SIZE):
+        chunk = [row['recall_number'] for row in rows[start:start + PROBE_CHUNK_SIZE]]
+        stored.update(
+            (stored_row.recall_number, stored_row)
+            for stored_row in db.session.execute(
+                db.select(table.c.recall_number, table.c.id, table.c.content_hash,
+                          table.c.status, table.c.recall_date, table.c.recall_firm)
+                .where(table.c.recall_number.in_(chunk))
+            )
+        )
+
+    now = datetime.utcnow()
+    updates = []
+    updated = []
+    replaced = []
+    for row in rows:
+        if row['recall_number'] not in stored:
+            continue
+        old = stored[row['recall_number']]
+        new_hash = row.get('content_hash') or content_hash(row)
+        if new_hash == old.content_hash:
+            continue
+        update = {column: row[column] for column in UPDATE_COLUMNS}
+        update.update(_id=old.id, content_hash=new_hash, updated_at=now)
+        updates.append(update)
+        updated.append(row['recall_number'])
+        replaced.append(old._asdict())
+    if updates:
+        db.session.execute(db.update(table).where(table.c.id == db.bindparam('_id')), updates)
+        if live:
+            record_stat_changes(added=updates, removed=replaced)
+            bump_data_version()
+    return updated
+
+def safe_upsert_recalls(rows, update_existing=False, table=None):
+    """
+    Same as upsert_recalls, but a bad record only costs itself
+
+    The page is written inside a savepoint. If the database rejects a
+    record in the batch (IntegrityError, DataError), the savepoint is
+    rolled back and the rows are retried one at a time so the offending
+    records can be skipped and reported. Any other error, such as
+    "database is locked", says nothing about the records and is raised,
+    so the caller's run fails and resumes from its last checkpoint
+    instead of dropping the page.
+    """
+    try:
+        with db.session.begin_nested():
+            return upsert_recalls(rows, update_existing=update_existing, table=table)
+    except (IntegrityError, DataError) as e:
+        print(f"Bulk write of {len(rows)} rows failed, retrying row by row: {e}")
+
+    inserted = {}
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                inserted.update(upsert_recalls([row], update_existing=update_existing, table=table))
+        except (IntegrityError, DataError) as e:
+            print(f"Skipping recall {row.get('recall_number')}: {e}")
+    return inserted
@@ -1,65 +1,248 @@
 #!/usr/bin/env python3
 """
-Script to delete all recalls and refetch from FDA API
+Script to rebuild all recalls from the FDA without downtime
 This will ensure all records use the latest extraction logic.
 
-WARNING: This will delete all existing recalls and re-fetch them.
-This may take a while depending on how many recalls there are.
+The full dataset is loaded into a shadow table while the live table keeps
+serving the dashboard and API. Once loading finishes, the row count is
+checked and the shadow table is swapped in with a single transaction
+(rename live -> old, rename shadow -> live, drop old, build indexes,
+rebuild the full-text search index and statistics), so
+readers see either the complete old dataset or the complete new one,
+never a partial table. If loading fails, the live table is untouched.
 
-Run: python3 refetch_all_recalls.py
+Recall ids and created_at values are carried over for recalls that
+already exist, so links and references to existing recalls stay valid.
+The rebuild holds the fetch job slot from start to swap, so no fetch
+inserts recalls into the live table while the shadow is loading (they
+would be dropped by the swap and their ids handed out again), and the
+ERPNext dispatcher, whose outbox rows point at recall ids, waits for it.
+
+Run: python3 refetch_all_recalls.py [--from-file device-recall-0001-of-0001.json.zip]
 """
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+
 from app import app
 from models import FDADeviceRecall
 from database import db
-from fetch_fda_recalls import fetch_fda_recalls
+from recall_store import safe_upsert_recalls
+from recall_search import rebuild_search_index
+from recall_stats import rebuild_stats
+from fetch_fda_recalls import BATCH_SIZE, MAX_SKIP, build_recall_rows
+from fetch_jobs import JobProgress, create_fetch_job, finish_fetch_job
+
+LIVE_TABLE = FDADeviceRecall.__tablename__
+SHADOW_TABLE = f'{LIVE_TABLE}_shadow'
+OLD_TABLE = f'{LIVE_TABLE}_old'
+SHADOW_UNIQUE_INDEX = f'ix_{SHADOW_TABLE}_recall_number'
+
+# Refuse to swap in a dataset that is much smaller than the live one
+MIN_ROW_RATIO = 0.95
+
+def build_shadow_table():
+    """
+    (Re)create the empty shadow table
+
+    Only the unique recall_number index is created up front, because the
+    bulk upsert relies on it; the remaining indexes are built once, after
+    loading, as part of the swap.
+    """
+    columns = []
+    for column in FDADeviceRecall.__table__.columns:
+        column = column._copy()
+        if column.name != 'recall_number':
+            column.index = None
+        columns.append(column)
+    shadow = db.Table(SHADOW_TABLE, db.MetaData(), *columns)
+    shadow.drop(db.engine, checkfirst=True)
+    shadow.create(db.engine)
+    return shadow
+
+class _IdAllocator:
+    """Keep ids of recalls that already exist and hand out fresh ids above the live maximum"""
+
+    def __init__(self):
+        self.next_id = (db.session.query(db.func.max(FDADeviceRecall.id)).scalar() or 0) + 1
+
+    def assign(self, rows):
+        live = FDADeviceRecall.__table__
+        known = {}
+        numbers = [row['recall_number'] for row in rows]
+        for start in range(0, len(numbers), 500):
+            known.update(
+                (recall_number, (recall_id, created_at))
+                for recall_number, recall_id, created_at in db.session.execute(
+                    db.select(live.c.recall_number, live.c.id, live.c.created_at)
+                    .where(live.c.recall_number.in_(numbers[start:start + 500]))
+                )
+            )
+        for row in rows:
+            if row['recall_number'] in known:
+                row['id'], row['created_at'] = known[row['recall_number']]
+            else:
+                row['id'] = self.next_id
+                self.next_id += 1
+        return rows
+
+def load_shadow_from_api(shadow, workers=4, progress=None):
+    """Load every recall into the shadow table using the windowed backfill fetch"""
+    from backfill_recalls import BACKFILL_START, fetch_window, plan_windows
+
+    print(f"Planning windows from {BACKFILL_START} to {date.today()}...")
+    windows = plan_windows(BACKFILL_START, date.today(), workers=workers)
+    expected = sum(min(total, MAX_SKIP) for _, _, total in windows)
+    print(f"{len(windows)} windows, {expected} records expected")
+
+    ids = _IdAllocator()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_window, start, end): (start, end, total) for start, end, total in windows}
+        for finished, future in enumerate(as_completed(futures), 1):
+            start, end, total = futures[future]
+            results, elapsed = future.result()  # a failed window aborts the rebuild
+            for offset in range(0, len(results), BATCH_SIZE):
+                rows = ids.assign(build_recall_rows(results[offset:offset + BATCH_SIZE]))
+                safe_upsert_recalls(rows, table=shadow)
+            if progress:
+                progress(pages=1, seen=len(results))
+            db.session.commit()
+            print(f"[{finished}/{len(windows)}] {start} – {end}: {len(results)}/{total} records ({elapsed:.1f}s)")
+    return expected
+
+def load_shadow_from_file(shadow, path, progress=None):
+    """Load every recall in an openFDA bulk download into the shadow table"""
+    from import_bulk_recalls import iter_bulk_records
+
+    ids = _IdAllocator()
+    read = 0
+    batch = []
+    for item in iter_bulk_records(path):
+        batch.append(item)
+        read += 1
+        if len(batch) >= BATCH_SIZE:
+            safe_upsert_recalls(ids.assign(build_recall_rows(batch)), table=shadow)
+            if progress:
+                progress(pages=1, seen=len(batch))
+            db.session.commit()
+            batch.clear()
+            print(f"  {read} records loaded")
+    if batch:
+        safe_upsert_recalls(ids.assign(build_recall_rows(batch)), table=shadow)
+        db.session.commit()
+    return read
 
-def refetch_all():
-    """Delete all recalls and refetch"""
+def swap_in_shadow_table(shadow):
+    """
+    Atomically replace the live table with the loaded shadow table
+
+    Everything happens in one transaction, so a concurrent reader sees
+    either the old table or the fully indexed new one.
+    """
+    with db.engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            # pysqlite does not open a transaction for DDL on its own
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+        conn.execute(db.text(f'ALTER TABLE {LIVE_TABLE} RENAME TO {OLD_TABLE}'))
+        conn.execute(db.text(f'ALTER TABLE {SHADOW_TABLE} RENAME TO {LIVE_TABLE}'))
+        conn.execute(db.text(f'DROP TABLE {OLD_TABLE}'))
+        conn.execute(db.text(f'DROP INDEX {SHADOW_UNIQUE_INDEX}'))
+        for index in FDADeviceRecall.__table__.indexes:
+            index.create(conn)
+        # The search triggers went with the old table; point the FTS index at the new rows
+        rebuild_search_index(conn)
+        rebuild_stats(conn)
+        if conn.dialect.name == 'postgresql':
+            # Ids were assigned explicitly; move the sequence past them
+            conn.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{LIVE_TABLE}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {LIVE_TABLE}))"
+            ))
+
+def refetch_all(path=None, workers=4, force=False):
+    """Rebuild the recall table in a shadow copy and swap it in"""
     with app.app_context():
-        # Count existing records
-        total = FDADeviceRecall.query.count()
-        print(f"Current recalls in database: {total}")
-        print("")
-        
-        response = input("Are you sure you want to delete all recalls and refetch? (yes/no): ")
-        if response.lower() != 'yes':
-            print("Cancelled.")
-            return
-        
-        print("")
-        print("Deleting all existing recalls...")
-        
-        # Delete all records
-        FDADeviceRecall.query.delete()
+        job, created = create_fetch_job('refetch')
+        if not created:
+            print(f"✗ Fetch job {job.id} is {job.status}; run the rebuild once it has finished")
+            return False
+        job.status = 'running'
+        job.stage = 'Loading shadow table'
+        job.started_at = datetime.now()
         db.session.commit()
-        
-        print(f"✓ Deleted {total} records")
-        print("")
-        print("Fetching all recalls from FDA API...")
-        print("This may take several minutes...")
-        print("")
-        
-        # Fetch all recalls
-        result = fetch_fda_recalls()
-        
-        print("")
-        print("=== Refetch Complete ===")
-        print(result)
-        
-        # Count new records
-        new_total = FDADeviceRecall.query.count()
-        print(f"New total recalls: {new_total}")
+        job_id = job.id  # the session is closed before the swap
+
+        try:
+            swapped = _rebuild(JobProgress(job), path, workers, force)
+        except Exception as e:
+            db.session.rollback()
+            finish_fetch_job(job_id, f"Error: {e}", failed=True)
+            raise
+        finish_fetch_job(job_id, 'Rebuilt and swapped in' if swapped else 'Not swapped: row count check failed',
+                         failed=not swapped)
+        return swapped
+
+def _rebuild(progress, path, workers, force):
+    """Load the shadow table and swap it in; runs while holding the fetch job slot"""
+    started = time.time()
+    total = FDADeviceRecall.query.count()
+    print(f"Current recalls in database: {total}")
+    print("")
+
+    print(f"Loading shadow table {SHADOW_TABLE}...")
+    shadow = build_shadow_table()
+    try:
+        if path:
+            expected = load_shadow_from_file(shadow, path, progress=progress)
+        else:
+            expected = load_shadow_from_api(shadow, workers=workers, progress=progress)
+    except Exception:
+        db.session.rollback()
+        shadow.drop(db.engine, checkfirst=True)
+        print("✗ Loading failed; the live table was not changed")
+        raise
+
+    loaded = db.session.execute(db.select(db.func.count()).select_from(shadow)).scalar()
+    print("")
+    print(f"Shadow table rows: {loaded} (expected about {expected}, live table has {total})")
+
+    if not loaded or loaded < total * MIN_ROW_RATIO:
+        if not force:
+            shadow.drop(db.engine, checkfirst=True)
+            print(f"✗ Shadow table has fewer than {MIN_ROW_RATIO:.0%} of the live rows; not swapping. "
+                  f"Re-run with --force to swap anyway.")
+            return False
+        print("⚠ Row count check failed, swapping anyway (--force)")
+
+    print("Building indexes and swapping tables...")
+    progress(stage='Swapping tables')
+    db.session.close()
+    swap_in_shadow_table(shadow)
+
+    print("")
+    print("=== Rebuild Complete ===")
+    print(f"Previous total: {total}")
+    print(f"New total recalls: {FDADeviceRecall.query.count()}")
+    print(f"Elapsed: {time.time() - started:.1f}s")
+    return True
 
 if __name__ == '__main__':
-    print("=== Refetch All Recalls ===")
+    parser = argparse.ArgumentParser(description="Rebuild all recalls without downtime")
+    parser.add_argument('--from-file', dest='path',
+                        help="Load from an openFDA bulk download instead of the API")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Date windows fetched in parallel from the API (default 4)")
+    parser.add_argument('--force', action='store_true',
+                        help=f"Swap even if the new table has fewer than {MIN_ROW_RATIO:.0%} of the current rows")
+    args = parser.parse_args()
+
+    print("=== Rebuild All Recalls ===")
     print("")
     print("This will:")
-    print("  1. Delete all existing recalls from the database")
-    print("  2. Re-fetch all recalls from the FDA API")
-    print("  3. Apply the latest Model/Catalog Number extraction logic")
-    print("")
-    print("WARNING: This will take a while and will temporarily remove all data!")
+    print("  1. Load every recall into a shadow table (the live table keeps serving)")
+    print("  2. Apply the latest Part and Model/Catalog Number extraction logic")
+    print("  3. Check the row count and atomically swap the new table in")
     print("")
-    
-    refetch_all()
 
+    refetch_all(path=args.path, workers=args.workers, force=args.force)
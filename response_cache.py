@@ -0,0 +1,309 @@
+"""
+Shared response cache for the read-only pages and API endpoints
+
+Recall data only changes when a fetch, backfill, import or rebuild
+commits, yet every gunicorn worker used to render the same dashboard,
+/api/recalls and /api/stats responses again for each request. Views
+decorated with cached_response are rendered once per data version and
+served from a cache shared by all workers until the data changes.
+
+Invalidation: the data_version row is bumped by every write that
+changes stored recalls, in the same transaction (see recall_store and
+recall_stats.rebuild_stats). Cache entries remember the version they
+were rendered for, so entries from an older version are simply misses.
+Fetch runs that find nothing new leave the version, and the cache, alone.
+
+Responses carry an ETag (a hash of the body) and Last-Modified (when
+the data last changed), and conditional requests that still match are
+answered with 304 Not Modified without rendering anything.
+
+Values that are expensive to compute but not whole responses, such as
+the match counts of paged API requests, are kept the same way with
+cached_value.
+
+Backends (RESPONSE_CACHE_BACKEND):
+    sqlite  a SQLite file shared by every worker process (default)
+    memory  a per-process LRU, for the development server
+    none    no caching; ETags and 304s still work
+Other backends can be plugged in with set_cache_backend().
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import db
+from models import DataVersion
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'sqlite')
+RESPONSE_CACHE_FILE = os.environ.get(
+    'RESPONSE_CACHE_FILE',
+    os.path.join(tempfile.gettempdir(), 'fda_recall_checker_response_cache.db')
+)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 2000))
+
+# The data_version row that tracks the recall data
+DATA_VERSION_NAME = 'recalls'
+
+CachedResponse = namedtuple('CachedResponse', 'version etag content_type body')
+
+class CacheBackend:
+    """
+    Interface of a response cache backend
+
+    Implementations must be safe to call from several threads, and
+    should be shared between processes to be worth much under gunicorn.
+    """
+
+    def get(self, key):
+        """The CachedResponse stored under key, or None"""
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        """Store a CachedResponse under key, replacing any older entry"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Drop every entry"""
+        raise NotImplementedError
+
+class NullCacheBackend(CacheBackend):
+    """Caches nothing"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry):
+        pass
+
+    def clear(self):
+        pass
+
+class MemoryCacheBackend(CacheBackend):
+    """Least-recently-used cache private to one process"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache in a SQLite file that every worker process opens
+
+    The file is separate from the application database, so cache writes
+    never wait on an ingest transaction. Each thread of each process
+    keeps its own connection.
+    """
+    # Entries beyond max_entries are pruned, oldest first, every PRUNE_EVERY writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        # Connections must not cross a fork, so one opened in the gunicorn master is not reused
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, version INTEGER NOT NULL, etag TEXT NOT NULL, '
+                'content_type TEXT NOT NULL, body BLOB NOT NULL, stored_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT version, etag, content_type, body FROM response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        return CachedResponse(row[0], row[1], row[2], bytes(row[3])) if row else None
+
+    def set(self, key, entry):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, version, etag, content_type, body, stored_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, entry.version, entry.etag, entry.content_type, entry.body, time.time())
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            conn.execute(
+                'DELETE FROM response_cache WHERE key NOT IN '
+                '(SELECT key FROM response_cache ORDER BY stored_at DESC LIMIT ?)', (self.max_entries,)
+            )
+
+    def clear(self):
+        self._connect().execute('DELETE FROM response_cache')
+
+BACKENDS = {
+    'sqlite': SQLiteCacheBackend,
+    'memory': MemoryCacheBackend,
+    'none': NullCacheBackend,
+}
+
+_backend = None
+
+def get_cache_backend():
+    """The process's cache backend, created from RESPONSE_CACHE_BACKEND on first use"""
+    global _backend
+    if _backend is None:
+        if RESPONSE_CACHE_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND {RESPONSE_CACHE_BACKEND!r}; "
+                             f"expected one of {', '.join(BACKENDS)}")
+        _backend = BACKENDS[RESPONSE_CACHE_BACKEND]()
+    return _backend
+
+def set_cache_backend(backend):
+    """Use a different CacheBackend from now on"""
+    global _backend
+    _backend = backend
+
+def bump_data_version(conn=None):
+    """
+    Mark the recall data as changed, invalidating every cached response
+
+    Runs in the caller's transaction (conn, or the session's), so the new
+    version becomes visible together with the data; the caller commits.
+    """
+    conn = conn or db.session.connection()
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    result = conn.execute(
+        db.update(table)
+        .where(table.c.name == DATA_VERSION_NAME)
+        .values(version=table.c.version + 1, updated_at=now)
+    )
+    if not result.rowcount:
+        conn.execute(db.insert(table).values(name=DATA_VERSION_NAME, version=1, updated_at=now))
+
+def current_data_version():
+    """
+    Returns:
+        (version, time of the last change or None); (0, None) before any data was written
+    """
+    row = db.session.execute(
+        db.select(DataVersion.version, DataVersion.updated_at).where(DataVersion.name == DATA_VERSION_NAME)
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+def cache_key(vary=None):
+    """Route and query arguments of the current request, in a stable order, and the vary value"""
+    key = f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+    return f"{key}#{vary}" if vary is not None else key
+
+def _cache_call(method, *args):
+    # A broken cache must never take the page down with it
+    try:
+        return getattr(get_cache_backend(), method)(*args)
+    except Exception as e:
+        logging.warning(f"Response cache {method} failed: {e}")
+        return None
+
+def cached_value(key, compute):
+    """
+    Return compute(), shared by all workers until the data version changes
+
+    Args:
+        key: Cache key; must not look like a request path (start with '/')
+        compute: Callable returning a JSON-serializable value
+    """
+    try:
+        version, _ = current_data_version()
+    except SQLAlchemyError as e:
+        logging.warning(f"Could not read the data version, not caching: {e}")
+        db.session.rollback()
+        return compute()
+
+    entry = _cache_call('get', key)
+    if entry is not None and entry.version == version:
+        return json.loads(entry.body)
+    value = compute()
+    body = json.dumps(value).encode('utf-8')
+    _cache_call('set', key, CachedResponse(version, hashlib.sha1(body).hexdigest(), 'application/json', body))
+    return value
+
+def cached_response(view=None, vary=None):
+    """
+    Serve a read-only view from the shared cache until the data version changes
+
+    Only 200 responses to GET/HEAD are cached. Every response gets an
+    ETag and Last-Modified, and is revalidated by clients (no-cache), so
+    polling with If-None-Match costs one version lookup and one cache read.
+
+    Args:
+        view: The view function; omit to pass options, @cached_response(vary=...)
+        vary: Callable returning whatever else, besides the data and the
+            request, the body depends on (such as the current month); it
+            becomes part of the cache key
+    """
+    if view is None:
+        return functools.partial(cached_response, vary=vary)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+        try:
+            version, modified = current_data_version()
+        except SQLAlchemyError as e:
+            logging.warning(f"Could not read the data version, not caching: {e}")
+            db.session.rollback()
+            return view(*args, **kwargs)
+
+        key = cache_key(vary() if vary else None)
+        entry = _cache_call('get', key)
+        if entry is not None and entry.version == version:
+            response = current_app.response_class(entry.body, content_type=entry.content_type)
+            outcome = 'HIT'
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            entry = CachedResponse(version, hashlib.sha1(body).hexdigest(), response.content_type, body)
+            _cache_call('set', key, entry)
+            outcome = 'MISS'
+
+        response.set_etag(entry.etag)
+        if modified is not None:
+            response.last_modified = modified
+        response.cache_control.no_cache = True
+        response.headers['X-Cache'] = outcome
+        return response.make_conditional(request)
+    return wrapper
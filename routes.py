@@ -1,10 +1,14 @@
 """
 Flask routes for FDA Recall Checker
 """
-from flask import Blueprint, jsonify, request
-from database import db
-from models import FDADeviceRecall
-from fetch_fda_recalls import fetch_fda_recalls
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from models import FDADeviceRecall, FetchJob
+from fetch_jobs import start_fetch_job
+from recall_search import search_recalls
+from recall_pages import InvalidCursor, cached_total, clamp_per_page, keyset_page
+from recall_export import FORMATS, export_stream, next_since, parse_since
+from recall_stats import get_stats, get_top, get_total
+from response_cache import cached_response
 from datetime import datetime
 
 fetch_recalls_bp = Blueprint('fetch_recalls', __name__)
@@ -12,34 +16,56 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 @fetch_recalls_bp.route('/fetch', methods=['POST', 'GET'])
 def fetch_recalls():
-    """Manually trigger FDA recall fetch"""
+    """Manually trigger FDA recall fetch; runs in the background, poll /api/jobs/<id>
+
+    Pass force=1 to fetch even when openFDA reports no changes since the last run.
+    """
     try:
-        result = fetch_fda_recalls()
-        return jsonify({'success': True, 'message': result})
+        force = request.args.get('force', '').lower() in ('1', 'true', 'yes')
+        job, created = start_fetch_job('manual', force=force)
+        message = 'Fetch started' if created else 'A fetch is already in progress'
+        return jsonify({
+            'success': True,
+            'message': message,
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}',
+            'job': job.to_dict()
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@api_bp.route('/jobs/<int:job_id>')
+def api_job_status(job_id):
+    """API endpoint to poll the progress of a fetch job"""
+    job = FetchJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
 @api_bp.route('/recalls')
+@cached_response
 def api_recalls():
-    """API endpoint to get recalls"""
+    """API endpoint to get recalls
+
+    Pass after= (empty for the first page, then each response's
+    next_cursor) to walk recalls newest first with keyset pagination;
+    add total=1 to include the (cached) number of matches.
+    Without after=, page= selects a page by number.
+    """
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
+    per_page = clamp_per_page(request.args.get('per_page', 50, type=int))
     search = request.args.get('search', '', type=str)
     
+    if 'after' in request.args:
+        return api_recalls_keyset(search, request.args.get('after') or None, per_page)
+    
     query = FDADeviceRecall.query
     
     if search:
-        query = query.filter(
-            db.or_(
-                FDADeviceRecall.device_name.contains(search),
-                FDADeviceRecall.recall_number.contains(search),
-                FDADeviceRecall.recall_firm.contains(search)
-            )
-        )
+        # Best matches first
+        query = search_recalls(query, search)
+    else:
+        query = query.order_by(FDADeviceRecall.recall_date.desc())
     
-    pagination = query.order_by(
-        FDADeviceRecall.recall_date.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
     return jsonify({
         'recalls': [recall.to_dict() for recall in pagination.items],
@@ -48,28 +74,78 @@ def api_recalls():
         'current_page': page
     })
 
+def api_recalls_keyset(search, after, per_page):
+    """Cursor mode of /api/recalls"""
+    query = FDADeviceRecall.query
+    if search:
+        # Keyset order is (recall_date, id), not relevance
+        query = search_recalls(query, search, ranked=False)
+    try:
+        recalls, next_cursor = keyset_page(query, after, per_page)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = {
+        'recalls': [recall.to_dict() for recall in recalls],
+        'next_cursor': next_cursor,
+        'per_page': per_page
+    }
+    if request.args.get('total', '').lower() in ('1', 'true', 'yes'):
+        result['total'] = cached_total(query, search)
+    return jsonify(result)
+
+@api_bp.route('/recalls/export')
+def api_recalls_export():
+    """Stream every matching recall as NDJSON (default) or CSV
+
+    format=ndjson|csv, gzip=1 to compress, search= to filter like
+    /api/recalls, since= (ISO date or date-time, UTC) for only recalls
+    created or updated since then. The X-Export-Next-Since header is the
+    since= to pass on the next incremental pull; it overlaps this export.
+    """
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in FORMATS:
+        return jsonify({'error': f"Unknown format {fmt!r}; use {' or '.join(FORMATS)}"}), 400
+    try:
+        since = parse_since(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': f"Invalid since: {request.args['since']!r}; use an ISO date or date-time"}), 400
+    search = request.args.get('search', '', type=str)
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    started = datetime.utcnow()
+    
+    response = Response(
+        stream_with_context(export_stream(fmt, search=search, since=since, compress=compress)),
+        mimetype='application/gzip' if compress else FORMATS[fmt]
+    )
+    filename = f"recalls.{fmt}{'.gz' if compress else ''}"
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Export-Next-Since'] = next_since(started).isoformat(timespec='seconds') + 'Z'
+    return response
+
 @api_bp.route('/recalls/<int:recall_id>')
+@cached_response
 def api_recall_detail(recall_id):
     """API endpoint to get a specific recall"""
     recall = FDADeviceRecall.query.get_or_404(recall_id)
     return jsonify(recall.to_dict())
 
+def current_month():
+    """Month that recent_count counts, e.g. '2026-10'"""
+    return datetime.now().strftime('%Y-%m')
+
 @api_bp.route('/stats')
+@cached_response(vary=current_month)
 def api_stats():
     """API endpoint for statistics"""
-    total = FDADeviceRecall.query.count()
-    by_status = db.session.query(
-        FDADeviceRecall.status,
-        db.func.count(FDADeviceRecall.id)
-    ).group_by(FDADeviceRecall.status).all()
-    
-    recent_count = FDADeviceRecall.query.filter(
-        FDADeviceRecall.recall_date >= datetime.now().replace(day=1)
-    ).count()
+    # Read from the recall_stat table, maintained as recalls are written
+    by_month = get_stats('month')
     
     return jsonify({
-        'total': total,
-        'by_status': {status: count for status, count in by_status},
-        'recent_count': recent_count
+        'total': get_total(),
+        'by_status': get_stats('status'),
+        'recent_count': by_month.get(current_month(), 0),
+        'by_month': dict(sorted(by_month.items())),
+        'top_firms': dict(get_top('firm', 20))
     })
 
@@ -0,0 +1,87 @@
+"""
+Per-stage timing and throughput for fetch and dispatch runs
+
+A RunTimings is passed down the fetch path alongside the progress
+callback. Each stage adds the seconds it spent, the openFDA client adds
+pages and bytes, and at the end the totals are copied onto the run's
+RecallCheckHistory row for the /stats trend.
+
+Stages:
+    http      time the ingest loop waited for the next page (network,
+              rate limiting and retries)
+    decode    JSON decoding of responses, summed over the fetch threads
+              (it overlaps the HTTP wait)
+    extract   building rows and extracting part/model numbers
+    dedup     comparing fetched recalls with stored content hashes and
+              rewriting the changed ones
+    write     inserting new recalls, queueing them for ERPNext and committing
+    dispatch  sending queued recalls to ERPNext
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ('http', 'decode', 'extract', 'dedup', 'write', 'dispatch')
+
+class RunTimings:
+    """Accumulates stage times and transfer counts for one run; safe to share between threads"""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.pages = 0
+        self.bytes = 0
+        self.records = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as part of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def timed(self, iterable, stage):
+        """Yield from iterable, charging the wait for each item to a stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_page(self, nbytes):
+        """Count one openFDA response of nbytes"""
+        with self._lock:
+            self.pages += 1
+            self.bytes += nbytes
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def apply(self, history):
+        """Copy the totals onto a RecallCheckHistory row"""
+        elapsed = self.elapsed
+        history.duration_seconds = round(elapsed, 3)
+        for stage in STAGES:
+            setattr(history, f'{stage}_seconds', round(self.seconds[stage], 3))
+        history.pages_fetched = self.pages
+        history.bytes_fetched = self.bytes
+        history.records_processed = self.records
+        history.records_per_second = round(self.records / elapsed, 1) if elapsed > 0 else None
+        return history
+
+    def summary(self):
+        """One-line summary for the log"""
+        stages = ', '.join(f"{stage} {self.seconds[stage]:.1f}s" for stage in STAGES if self.seconds[stage])
+        return (f"{self.elapsed:.1f}s total ({stages or 'no stages timed'}); "
+                f"{self.pages} pages, {self.bytes / 1e6:.1f} MB, {self.records} records")
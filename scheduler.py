@@ -1,44 +1,284 @@
 """
 Scheduler for automatic FDA recall fetching
-Runs daily to fetch new recalls from FDA API
+Runs every FETCH_INTERVAL_HOURS (daily by default) to fetch new recalls from FDA API;
+each run starts with a cheap freshness probe, so frequent polling costs
+two requests when nothing has changed
+
+Every gunicorn worker starts a scheduler, but only one of them leads:
+leadership is a row lease in the scheduler_lease table, renewed by a
+heartbeat and taken over by another worker once it expires. Scheduled
+jobs run only on the leader. Each scheduled fetch is also recorded in the
+job_run table under its schedule slot; the unique (job, slot) key makes
+a slot run exactly once across the deployment, a still-running fetch
+blocks the next one, and a slot missed while no leader was up is run
+as soon as a leader appears.
 """
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+import atexit
 import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
 
 # Import will be done inside function to avoid circular imports
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LEASE_NAME = 'scheduler'
+LEASE_TTL = timedelta(seconds=int(os.environ.get('SCHEDULER_LEASE_SECONDS', 60)))
+HEARTBEAT_SECONDS = max(int(LEASE_TTL.total_seconds()) // 4, 1)
+# Fetch schedule: every FETCH_INTERVAL_HOURS, aligned to 2:00 AM
+FETCH_HOUR = 2
+FETCH_MINUTE = 0
+FETCH_INTERVAL_HOURS = int(os.environ.get('FETCH_INTERVAL_HOURS', 24))
+if FETCH_INTERVAL_HOURS < 1 or 24 % FETCH_INTERVAL_HOURS:
+    raise ValueError(f"FETCH_INTERVAL_HOURS must divide 24, got {FETCH_INTERVAL_HOURS}")
+FETCH_HOURS = sorted((FETCH_HOUR + k * FETCH_INTERVAL_HOURS) % 24 for k in range(24 // FETCH_INTERVAL_HOURS))
+FETCH_JOB = 'daily_fda_fetch'
+# A missed slot older than this is not caught up (the next slot covers it)
+MISFIRE_GRACE = min(timedelta(hours=20), timedelta(hours=FETCH_INTERVAL_HOURS))
+# A run still marked running after this long is assumed to have died with its worker
+STALE_RUN = timedelta(hours=6)
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_is_leader = False
+
+def _app():
+    from app import app
+    return app
+
+def renew_lease():
+    """
+    Take or renew the scheduler lease for this process
+
+    A conditional UPDATE succeeds only if we already hold the lease or it
+    has expired, so at most one process can hold it at a time.
+
+    Returns:
+        True if this process is the leader
+    """
+    from sqlalchemy.exc import IntegrityError
+    from database import db
+    from models import SchedulerLease
+
+    now = datetime.now()
+    table = SchedulerLease.__table__
+    result = db.session.execute(
+        db.update(table)
+        .where(table.c.name == LEASE_NAME,
+               db.or_(table.c.holder == HOLDER_ID, table.c.expires_at < now))
+        .values(holder=HOLDER_ID, expires_at=now + LEASE_TTL, heartbeat_at=now)
+    )
+    db.session.commit()
+    if result.rowcount:
+        return True
+    if db.session.get(SchedulerLease, LEASE_NAME) is not None:
+        return False
+    try:
+        db.session.add(SchedulerLease(name=LEASE_NAME, holder=HOLDER_ID,
+                                      expires_at=now + LEASE_TTL, heartbeat_at=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Another worker created it first
+        db.session.rollback()
+        return False
+
+def release_lease():
+    """Give up the lease on shutdown so another worker takes over immediately"""
+    if not _is_leader:
+        return
+    try:
+        from database import db
+        from models import SchedulerLease
+        with _app().app_context():
+            table = SchedulerLease.__table__
+            db.session.execute(
+                db.update(table)
+                .where(table.c.name == LEASE_NAME, table.c.holder == HOLDER_ID)
+                .values(expires_at=datetime.now())
+            )
+            db.session.commit()
+    except Exception as e:
+        logger.warning(f"Could not release scheduler lease: {e}")
+
+def last_fetch_slot(now=None):
+    """Most recent scheduled fetch time at or before now"""
+    now = now or datetime.now()
+    slot = now.replace(hour=FETCH_HOUR, minute=FETCH_MINUTE, second=0, microsecond=0)
+    if slot > now:
+        slot -= timedelta(days=1)
+    while slot + timedelta(hours=FETCH_INTERVAL_HOURS) <= now:
+        slot += timedelta(hours=FETCH_INTERVAL_HOURS)
+    return slot
+
+def claim_slot(job, slot):
+    """
+    Record the start of a run for a schedule slot
+
+    Returns:
+        The JobRun, or None if the slot has already run or another run of
+        the job is still in progress
+    """
+    from sqlalchemy.exc import IntegrityError
+    from database import db
+    from models import JobRun
+
+    running = JobRun.query.filter(
+        JobRun.job == job, JobRun.status == 'running',
+        JobRun.started_at > datetime.now() - STALE_RUN
+    ).first()
+    if running:
+        logger.info(f"Skipping {job} for {slot}: run for {running.slot} still in progress")
+        return None
+    try:
+        run = JobRun(job=job, slot=slot, status='running', holder=HOLDER_ID, started_at=datetime.now())
+        db.session.add(run)
+        db.session.commit()
+        return run
+    except IntegrityError:
+        db.session.rollback()
+        return None
+
+def finish_run(run, status, result=None):
+    from database import db
+    run.status = status
+    run.finished_at = datetime.now()
+    run.result = str(result)[:500] if result is not None else None
+    db.session.commit()
+
+def run_fetch_slot(slot):
+    """Run the scheduled fetch for one slot unless it already ran"""
+    from fetch_jobs import create_fetch_job, run_fetch_job
+    from database import db
+    with _app().app_context():
+        try:
+            run = claim_slot(FETCH_JOB, slot)
+            if not run:
+                return None
+            # Shares the fetch_job slot with manual fetches, so the two never overlap
+            job, created = create_fetch_job('scheduled')
+            if not created:
+                finish_run(run, 'succeeded', f"Merged into fetch job {job.id} already in progress")
+                logger.info(f"Scheduled fetch merged into running fetch job {job.id}")
+                return None
+            logger.info(f"Starting scheduled FDA recall fetch for {slot}...")
+            try:
+                result = run_fetch_job(job.id)
+            except Exception as e:
+                finish_run(run, 'failed', e)
+                raise
+            finish_run(run, 'failed' if str(result).startswith('Error') else 'succeeded', result)
+            logger.info(f"Scheduled fetch completed: {result}")
+            return result
+        finally:
+            db.session.remove()
+
 def scheduled_fetch():
-    """Scheduled task to fetch FDA recalls"""
+    """Scheduled task to fetch FDA recalls (leader only)"""
     try:
-        from fetch_fda_recalls import fetch_fda_recalls
-        logger.info("Starting scheduled FDA recall fetch...")
-        result = fetch_fda_recalls()
-        logger.info(f"Scheduled fetch completed: {result}")
+        if _is_leader:
+            run_fetch_slot(last_fetch_slot())
     except Exception as e:
         logger.error(f"Error in scheduled fetch: {str(e)}", exc_info=True)
 
+def catch_up_missed_fetch():
+    """Run the latest fetch slot if it was missed while no leader was running"""
+    from models import JobRun
+    slot = last_fetch_slot()
+    if datetime.now() - slot > MISFIRE_GRACE:
+        return
+    with _app().app_context():
+        done = JobRun.query.filter_by(job=FETCH_JOB, slot=slot).first()
+    if not done:
+        logger.info(f"Catching up missed FDA recall fetch for {slot}")
+        run_fetch_slot(slot)
+
+def scheduled_erpnext_dispatch():
+    """Scheduled task to send queued recalls to ERPNext, including retries (leader only)"""
+    if not _is_leader:
+        return
+    try:
+        from erpnext_dispatch import dispatch_erpnext_outbox
+        result = dispatch_erpnext_outbox()
+        if result and result['batches']:
+            logger.info(f"ERPNext dispatch completed: {result}")
+    except Exception as e:
+        logger.error(f"Error in ERPNext dispatch: {str(e)}", exc_info=True)
+
+def heartbeat(scheduler=None):
+    """Renew the lease; on gaining leadership, catch up any missed fetch"""
+    global _is_leader
+    from database import db
+    try:
+        with _app().app_context():
+            try:
+                leader = renew_lease()
+            finally:
+                db.session.remove()
+    except Exception as e:
+        logger.warning(f"Scheduler heartbeat failed: {e}")
+        leader = False
+
+    if leader != _is_leader:
+        logger.info(f"Scheduler {HOLDER_ID} {'is now' if leader else 'is no longer'} the leader")
+        _is_leader = leader
+        if leader and scheduler is not None:
+            # Run outside the heartbeat so a long catch-up fetch doesn't delay renewals
+            scheduler.add_job(catch_up_missed_fetch, id='catch_up_fetch', replace_existing=True)
+
 def start_scheduler():
     """Start the background scheduler"""
     scheduler = BackgroundScheduler()
-    # Run daily at 2 AM
+    # Leader election: renew the lease well within its TTL
+    scheduler.add_job(
+        heartbeat,
+        trigger=IntervalTrigger(seconds=HEARTBEAT_SECONDS),
+        args=[scheduler],
+        id='scheduler_heartbeat',
+        name='Scheduler Leader Heartbeat',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    # Run daily at 2 AM, or every FETCH_INTERVAL_HOURS from then
     scheduler.add_job(
         scheduled_fetch,
-        trigger=CronTrigger(hour=2, minute=0),
-        id='daily_fda_fetch',
-        name='Daily FDA Recall Fetch',
-        replace_existing=True
+        trigger=CronTrigger(hour=','.join(str(h) for h in FETCH_HOURS), minute=FETCH_MINUTE),
+        id=FETCH_JOB,
+        name='Scheduled FDA Recall Fetch',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=int(MISFIRE_GRACE.total_seconds())
+    )
+    # Drain the ERPNext outbox (new recalls and retries) every 5 minutes
+    scheduler.add_job(
+        scheduled_erpnext_dispatch,
+        trigger=IntervalTrigger(minutes=5),
+        id='erpnext_dispatch',
+        name='ERPNext Outbox Dispatch',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
     scheduler.start()
-    logger.info("Scheduler started - will fetch FDA recalls daily at 2:00 AM")
+    atexit.register(release_lease)
+    if FETCH_INTERVAL_HOURS == 24:
+        when = f"daily at {FETCH_HOUR}:{FETCH_MINUTE:02d}"
+    else:
+        when = f"every {FETCH_INTERVAL_HOURS}h from {FETCH_HOUR}:{FETCH_MINUTE:02d}"
+    logger.info(f"Scheduler {HOLDER_ID} started - the elected leader will fetch FDA recalls {when}")
     return scheduler
 
 if __name__ == '__main__':
     # For testing - run immediately
+    from fetch_fda_recalls import fetch_fda_recalls
     print("Running test fetch...")
     fetch_fda_recalls()
     print("Test fetch completed")
-
@@ -1,5 +1,7 @@
-import requests
 import json
+import os
+
+from erpnext_dispatch import get_erpnext_session
 
 # Test data with realistic recall information
 test_recalls = [
@@ -15,22 +17,18 @@ test_recalls = [
     }
 ]
 
-# ERPNext API endpoint
-url = 'https://beta.surgi.shop/api/method/check_recall_inventory'
-headers = {
-    'Content-Type': 'application/json',
-    'Authorization': 'token ae0d7bdc5c61e8b:c637ae040a3eae7'
-}
+# ERPNext API endpoint (set ERPNEXT_URL to test against fake_fda_server.py instead)
+# Credentials come from the shared session; set HTTP_ARCHIVE_MODE=replay to run offline
+url = os.environ.get('ERPNEXT_URL', 'https://beta.surgi.shop/api/method/check_recall_inventory')
 
 print("=" * 60)
 print("Testing ERPNext Recall Integration")
 print("=" * 60)
-print(f"\nSending {len(test_recalls)} test recall(s) to ERPNext...")
+print(f"\nSending {len(test_recalls)} test recall(s) to {url}...")
 
 try:
-    response = requests.post(
+    response = get_erpnext_session().post(
         url,
-        headers=headers,
         json={'recalls': json.dumps(test_recalls)},
         timeout=30
     )
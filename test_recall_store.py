@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for the transaction guarantees of the bulk recall write path
+Runs against a throwaway SQLite database, never the configured one.
+Run: python3 test_recall_store.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+db_dir = tempfile.mkdtemp(prefix='fda_recall_store_test_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'test.db')}"
+os.environ['RESPONSE_CACHE_BACKEND'] = 'none'
+
+from sqlalchemy.exc import OperationalError
+
+from app import app
+from database import db
+from erpnext_dispatch import enqueue_recalls
+from models import ERPNextOutbox, FDADeviceRecall
+from recall_store import safe_upsert_recalls
+
+failures = 0
+
+def driver_in_transaction():
+    """Whether SQLite itself has a transaction open on the session's connection"""
+    return db.session.connection().connection.dbapi_connection.in_transaction
+
+def check(label, ok):
+    global failures
+    print(f"{'✓' if ok else '✗'} {label}")
+    if not ok:
+        failures += 1
+
+def recall_row(number, **extra):
+    row = {
+        'name': number, 'recall_number': number, 'device_name': 'Test Device',
+        'product_code': 'ABC', 'recall_date': date(2026, 1, 1), 'reason': 'Test',
+        'status': 'Open', 'recall_firm': 'Test Firm', 'code_info': None
+    }
+    row.update(extra)
+    return row
+
+with app.app_context():
+    db.create_all()
+
+    # A page written by safe_upsert_recalls stays in the caller's transaction
+    inserted = safe_upsert_recalls([recall_row('TEST-1'), recall_row('TEST-2')])
+    check("page inserted", len(inserted) == 2)
+    check("still inside the caller's transaction", driver_in_transaction())
+    db.session.rollback()
+    check("rollback removes the page", FDADeviceRecall.query.count() == 0)
+
+    # A rejected row is skipped; the rest of the page is kept, uncommitted
+    safe_upsert_recalls([recall_row('TEST-3')])
+    db.session.commit()
+    existing_id = FDADeviceRecall.query.filter_by(recall_number='TEST-3').one().id
+    inserted = safe_upsert_recalls([recall_row('TEST-4', id=existing_id + 1),
+                                    recall_row('TEST-5', id=existing_id)])  # duplicate id
+    check("bad row skipped, good row kept", set(inserted) == {'TEST-4'})
+    check("row-by-row retry stays in the transaction", driver_in_transaction())
+    db.session.rollback()
+    check("rollback removes the retried rows",
+          sorted(r.recall_number for r in FDADeviceRecall.query) == ['TEST-3'])
+
+    # New recalls and their ERPNext outbox rows are committed together or not at all
+    inserted = safe_upsert_recalls([recall_row('TEST-7')])
+    enqueue_recalls([{'id': recall_id, 'recall_number': number} for number, recall_id in inserted.items()])
+    db.session.rollback()  # e.g. the fetch crashed before its commit
+    check("rollback removes recall and outbox row together",
+          not FDADeviceRecall.query.filter_by(recall_number='TEST-7').count()
+          and not ERPNextOutbox.query.filter_by(recall_number='TEST-7').count())
+    inserted = safe_upsert_recalls([recall_row('TEST-7')])
+    check("the retried page inserts the recall again, so it is queued", list(inserted) == ['TEST-7'])
+    db.session.rollback()
+
+    # Errors that are not about a record (here: a missing table) are raised, not skipped
+    missing = db.Table('no_such_table', db.MetaData(), *(c._copy() for c in FDADeviceRecall.__table__.columns))
+    try:
+        safe_upsert_recalls([recall_row('TEST-6')], table=missing)
+        check("operational error raised", False)
+    except OperationalError:
+        check("operational error raised", True)
+    db.session.rollback()
+
+print("")
+if failures:
+    print(f"✗ {failures} check(s) failed")
+    sys.exit(1)
+print("✓ All checks passed")
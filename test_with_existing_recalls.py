@@ -3,7 +3,6 @@
 Test ERPNext integration with existing recalls from database
 Sends the 10 most recent recalls to ERPNext to check for inventory matches
 """
-import requests
 import json
 from datetime import datetime
 import sys
@@ -23,11 +22,11 @@ print()
 from database import db
 from models import FDADeviceRecall
 from app import app
+from erpnext_dispatch import get_erpnext_session
 
 # ERPNext Configuration
-ERPNEXT_URL = "https://beta.surgi.shop/api/method/check_recall_inventory"
-ERPNEXT_API_KEY = "ae0d7bdc5c61e8b"
-ERPNEXT_API_SECRET = "c637ae040a3eae7"
+# Credentials come from the shared session; set HTTP_ARCHIVE_MODE=replay to run offline
+ERPNEXT_URL = os.environ.get('ERPNEXT_URL', "https://beta.surgi.shop/api/method/check_recall_inventory")
 
 def test_erpnext_with_existing_recalls(limit=10):
     """Send existing recalls to ERPNext for testing"""
@@ -67,14 +66,8 @@ def test_erpnext_with_existing_recalls(limit=10):
         print("-" * 70)
         
         try:
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'token {ERPNEXT_API_KEY}:{ERPNEXT_API_SECRET}'
-            }
-            
-            response = requests.post(
+            response = get_erpnext_session().post(
                 ERPNEXT_URL,
-                headers=headers,
                 json={'recalls': formatted_recalls},  # Send as list, not JSON string
                 timeout=60
             )
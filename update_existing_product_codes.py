@@ -1,115 +1,165 @@
 #!/usr/bin/env python3
 """
-Migration script to update existing recalls with Model/Catalog Number
-extracted from product_description field.
+Reprocess stored recalls with the current Part Number and
+Model/Catalog Number extraction and update product_code.
 
-Run: python3 update_existing_product_codes.py
+Rows are streamed in primary-key order, one chunk at a time, so memory
+use does not grow with the table. Extraction is fanned out to a process
+pool, and changed product codes are written back with one bulk UPDATE
+per chunk. Progress is checkpointed after every chunk; an interrupted run
+continues where it stopped unless --restart is given.
+
+Run: python3 update_existing_product_codes.py [--workers 4] [--chunk-size 2000] [--restart]
 """
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from app import app
-from models import FDADeviceRecall
+from models import FDADeviceRecall, IngestCheckpoint
 from database import db
-import re
-
-def extract_model_catalog_number(text):
-    """Extract Model/Catalog Number from text (code_info or product_description)"""
-    if not text:
-        return None
-    
-    # Look for "Model/Catalog Number" or variations
-    # Pattern: "Model/Catalog Number: HX-400U-30" or "Model/Catalog Number HX-400U-30"
-    # Include lowercase letters in the pattern (A-Za-z0-9)
-    patterns = [
-        r'Model/Catalog Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Model/Catalog[:\s]+Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Catalog Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Model Number[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-        r'Model[:\s]+([A-Za-z0-9\s\-]+?)(?:;|,|\n|$)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-        if match:
-            model_number = match.group(1).strip()
-            # Clean up - remove extra whitespace, newlines
-            model_number = re.sub(r'\s+', ' ', model_number)
-            # Take first part before semicolon or comma if present
-            model_number = model_number.split(';')[0].split(',')[0].strip()
-            if model_number:
-                return model_number
-    
-    return None
-
-def update_product_codes():
+from extraction import extract_identifiers_batch
+from recall_store import UPDATE_COLUMNS, content_hash
+from response_cache import bump_data_version
+
+CHECKPOINT_SOURCE = 'reprocess'
+CHUNK_SIZE = 2000
+
+def iter_chunks(start_after=0, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of rows with id and the UPDATE_COLUMNS, in id order
+
+    Uses keyset pagination (WHERE id > last_id) so every chunk is an
+    indexed range scan, however deep into the table it is. All source
+    columns are read so content_hash can be recomputed for changed rows.
+    """
+    last_id = start_after
+    while True:
+        rows = db.session.execute(
+            db.select(
+                FDADeviceRecall.id,
+                *(getattr(FDADeviceRecall, column) for column in UPDATE_COLUMNS)
+            )
+            .where(FDADeviceRecall.id > last_id)
+            .order_by(FDADeviceRecall.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def _extract(rows):
+    """Run extraction for one chunk; executed in a worker process"""
+    return extract_identifiers_batch((row.code_info or "", row.device_name or "") for row in rows)
+
+def _changed_product_codes(rows, identifiers):
+    """
+    Build bulk UPDATE mappings for rows whose product_code would change
+
+    content_hash covers product_code, so each mapping carries the hash of
+    the updated row; otherwise the next fetch would see a stale hash and
+    rewrite the recall although nothing changed at the source.
+    """
+    mappings = []
+    for row, (part_number, model_catalog_number) in zip(rows, identifiers):
+        # Same precedence as ingest: Part Number first, then Model/Catalog Number.
+        # Rows where neither is found keep their current product_code (e.g. cfres_id)
+        new_product_code = part_number or model_catalog_number
+        if not new_product_code:
+            continue
+        new_product_code = new_product_code[:100]  # Match database field size
+        if new_product_code != row.product_code:
+            updated = dict(row._mapping, product_code=new_product_code)
+            mappings.append({'id': row.id, 'product_code': new_product_code,
+                             'content_hash': content_hash(updated)})
+    return mappings
+
+def update_product_codes(workers=None, chunk_size=CHUNK_SIZE, restart=False):
     """Update product_code for all existing recalls"""
+    workers = workers or os.cpu_count() or 1
     with app.app_context():
-        # Get all recalls
-        all_recalls = FDADeviceRecall.query.all()
-        total = len(all_recalls)
-        
-        print(f"Found {total} recalls to process...")
+        checkpoint = IngestCheckpoint.query.filter_by(
+            source=CHECKPOINT_SOURCE, completed=False
+        ).order_by(IngestCheckpoint.id.desc()).first()
+        if checkpoint and restart:
+            checkpoint.completed = True
+            checkpoint = None
+        if not checkpoint:
+            checkpoint = IngestCheckpoint(source=CHECKPOINT_SOURCE, search='id', last_skip=0)
+            db.session.add(checkpoint)
+        db.session.commit()
+
+        start_after = checkpoint.last_skip or 0
+        total = FDADeviceRecall.query.count()
+        remaining = FDADeviceRecall.query.filter(FDADeviceRecall.id > start_after).count()
+        if start_after:
+            print(f"Resuming after id {start_after}: {remaining} of {total} recalls left to process")
+        else:
+            print(f"Found {total} recalls to process with {workers} worker(s)...")
         print("")
-        
+
+        processed = 0
         updated_count = 0
-        skipped_count = 0
-        no_model_count = 0
-        
-        for i, recall in enumerate(all_recalls, 1):
-            if i % 100 == 0:
-                print(f"Processing {i}/{total}...")
-            
-            # Extract Model/Catalog Number from code_info first (more reliable),
-            # then fall back to device_name
-            model_catalog_number = extract_model_catalog_number(recall.code_info)
-            if not model_catalog_number:
-                model_catalog_number = extract_model_catalog_number(recall.device_name)
-            
-            if model_catalog_number:
-                # Limit to 100 chars to match database field size
-                new_product_code = model_catalog_number[:100]
-                
-                # Always update if we found a model number (even if product_code already exists)
-                # This ensures we get the Model/Catalog Number instead of cfres_id
-                if recall.product_code != new_product_code:
-                    # Debug specific record
-                    if recall.recall_number == 'Z-0570-2026':
-                        print(f"  DEBUG - Updating {recall.recall_number}:")
-                        print(f"    Old product_code: {recall.product_code}")
-                        print(f"    New product_code: {new_product_code}")
-                        print(f"    Code_info: {recall.code_info[:100] if recall.code_info else 'None'}")
-                    
-                    recall.product_code = new_product_code
-                    updated_count += 1
-                else:
-                    skipped_count += 1
-            else:
-                # Debug: show a few examples where model number wasn't found
-                if no_model_count < 5 and recall.code_info:
-                    print(f"  Debug - No model found in: {recall.code_info[:80]}...")
-                # Special debug for the specific record
-                if recall.recall_number == 'Z-0570-2026':
-                    print(f"  DEBUG - No model found for {recall.recall_number}:")
-                    print(f"    Code_info: {repr(recall.code_info)}")
-                    print(f"    Device_name: {repr(recall.device_name)}")
-                no_model_count += 1
-        
-        # Commit all changes
-        print("")
-        print("Committing changes to database...")
+        started = time.time()
+        chunks = iter_chunks(start_after, chunk_size)
+
+        def write(rows, identifiers):
+            nonlocal processed, updated_count
+            mappings = _changed_product_codes(rows, identifiers)
+            if mappings:
+                db.session.execute(db.update(FDADeviceRecall), mappings)
+                bump_data_version()
+            checkpoint.last_skip = rows[-1].id
+            checkpoint.records_written = (checkpoint.records_written or 0) + len(mappings)
+            db.session.commit()
+
+            processed += len(rows)
+            updated_count += len(mappings)
+            elapsed = time.time() - started
+            print(f"Processed {processed}/{remaining} "
+                  f"({processed / elapsed if elapsed else 0:.0f} rows/s), {updated_count} updated")
+
+        if workers <= 1:
+            for rows in chunks:
+                write(rows, _extract(rows))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Keep a bounded number of chunks in flight, written back in id order
+                in_flight = []
+                for rows in chunks:
+                    in_flight.append((rows, executor.submit(_extract, rows)))
+                    if len(in_flight) >= workers * 2:
+                        rows, future = in_flight.pop(0)
+                        write(rows, future.result())
+                for rows, future in in_flight:
+                    write(rows, future.result())
+
+        checkpoint.completed = True
         db.session.commit()
-        
+
+        elapsed = time.time() - started
         print("")
         print("=== Update Complete ===")
-        print(f"Total recalls processed: {total}")
-        print(f"Updated with Model/Catalog Number: {updated_count}")
-        print(f"Skipped (already correct or no model found): {skipped_count + no_model_count}")
-        print(f"  - Already had model number: {skipped_count}")
-        print(f"  - No model number found: {no_model_count}")
+        print(f"Total recalls processed: {processed}")
+        print(f"Updated product_code: {updated_count}")
+        print(f"Unchanged or no identifier found: {processed - updated_count}")
+        print(f"Throughput: {processed / elapsed if elapsed else 0:.0f} rows/s over {elapsed:.1f}s")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-run identifier extraction over stored recalls")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Extraction processes (default: number of CPUs)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f"Rows read and written per chunk (default {CHUNK_SIZE})")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore an unfinished run and start from the first row")
+    args = parser.parse_args()
+
     print("Starting product code update...")
-    print("This will extract Model/Catalog Numbers from device descriptions")
-    print("and update the product_code field.")
+    print("This will extract Part and Model/Catalog Numbers from code_info and")
+    print("device descriptions and update the product_code field.")
     print("")
-    
-    update_product_codes()
 
+    update_product_codes(workers=args.workers, chunk_size=args.chunk_size, restart=args.restart)